@@ -1,5 +1,9 @@
-from .connect import get_service
+from .connect import get_service, ServicePool
 from .query import get_column_headers, get_profile_info, get_totals, get_rows, results_to_pandas, run_query
+from .query import run_query_iter, run_query_async, run_query_many, run_query_batch, refresh_query
+from .cache import SQLiteCache
+from .ratelimit import RateLimiter
+from .tokens import TokenCache
 from .reports import monthly_ecommerce_overview
 from .reports import monthly_coupons_overview
 from .reports import monthly_google_ads_overview
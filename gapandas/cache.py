@@ -0,0 +1,127 @@
+"""
+Name: Caches Google Analytics API query results
+Description: Stores query results on the local filesystem in an SQLite database so that repeated queries with the
+same payload do not need to call the API again.
+"""
+
+import json
+import os.path
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+
+# Sentinel used to tell a missing ttl argument apart from ttl=None, which caches an entry permanently
+DEFAULT_TTL = object()
+
+
+def encode_results(results):
+    """Encode a Google Analytics API results set in a compact columnar form for storage.
+
+    :param results: Google Analytics API results set
+    :return: zlib compressed JSON bytes
+    """
+
+    meta = {key: value for key, value in results.items() if key != 'rows'}
+    columns = [list(column) for column in zip(*results.get('rows', []))]
+
+    return zlib.compress(json.dumps({'meta': meta, 'columns': columns}).encode('utf-8'))
+
+
+def decode_results(data):
+    """Decode a results set stored with encode_results().
+
+    :param data: zlib compressed JSON bytes
+    :return: Google Analytics API results set
+    """
+
+    stored = json.loads(zlib.decompress(data).decode('utf-8'))
+    results = stored['meta']
+
+    if stored['columns']:
+        results['rows'] = [list(row) for row in zip(*stored['columns'])]
+
+    return results
+
+
+class SQLiteCache:
+    """Query result cache stored in a local SQLite database.
+
+    Entries expire after ttl seconds, and once the stored results exceed max_bytes the least recently used entries are
+    evicted. Any object with the same get() and set() methods can be passed to run_query() as a cache instead.
+
+    Args:
+        path (str): Path to the SQLite database file, created if it does not exist
+        ttl (int, optional): Number of seconds an entry remains valid. Set to None to keep entries until evicted.
+        max_bytes (int, optional): Maximum total size of the stored results in bytes
+    """
+
+    def __init__(self, path='gapandas_cache.sqlite', ttl=86400, max_bytes=512 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS results '
+                               '(key TEXT PRIMARY KEY, data BLOB, size INTEGER, expires REAL, accessed REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        """Return the cached results set for a key, or None if it is missing or has expired.
+
+        :param key: Cache key returned by query.get_payload_key()
+        :return: Google Analytics API results set or None
+        """
+
+        now = time.time()
+
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute('SELECT data, expires FROM results WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            data, expires = row
+            if expires is not None and expires < now:
+                connection.execute('DELETE FROM results WHERE key = ?', (key,))
+                return None
+
+            connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+
+        return decode_results(data)
+
+    def set(self, key, results, ttl=DEFAULT_TTL):
+        """Store a results set under a key and evict the least recently used entries if the cache is full.
+
+        :param key: Cache key returned by query.get_payload_key()
+        :param results: Google Analytics API results set
+        :param ttl: Optional number of seconds the entry remains valid, overriding the cache default. None never
+            expires.
+        """
+
+        now = time.time()
+        ttl = self.ttl if ttl is DEFAULT_TTL else ttl
+        expires = None if ttl is None else now + ttl
+        data = encode_results(results)
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute('INSERT OR REPLACE INTO results (key, data, size, expires, accessed) '
+                               'VALUES (?, ?, ?, ?, ?)', (key, data, len(data), expires, now))
+            connection.execute('DELETE FROM results WHERE expires IS NOT NULL AND expires < ?', (now,))
+
+            total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total_size > self.max_bytes:
+                rows = connection.execute('SELECT key, size FROM results ORDER BY accessed').fetchall()
+                for old_key, size in rows:
+                    if total_size <= self.max_bytes:
+                        break
+                    connection.execute('DELETE FROM results WHERE key = ?', (old_key,))
+                    total_size -= size
+
+    def clear(self):
+        """Remove every entry from the cache."""
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute('DELETE FROM results')
@@ -6,22 +6,160 @@ Description: Authenticates with the Google Analytics API using a client secrets
 and returns a Google Analytics service for use in other functions.
 """
 
-import socket
+import hashlib
 import sys
 import os.path
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import httplib2
 from googleapiclient.discovery import build
+from googleapiclient.discovery_cache.base import Cache
+from googleapiclient.errors import UnknownApiNameOrVersion
 from oauth2client.service_account import ServiceAccountCredentials
+from gapandas import ratelimit
+from gapandas import tokens
 
-# Prevent "The read operation timed out" errors
-socket.setdefaulttimeout(500)
+SCOPES = "https://www.googleapis.com/auth/analytics.readonly"
+DISCOVERY_CACHE_DIR = os.path.join('~', '.cache', 'gapandas', 'discovery')
 
+# Socket timeout in seconds for API requests, long enough for slow queries on large views
+DEFAULT_TIMEOUT = 500
 
-def get_service(keyfile_path, verbose=False):
+# Services built by get_service() in each thread, so threads never share an httplib2.Http. clear_services() bumps the
+# generation to make every thread build its services again.
+_local = threading.local()
+_generation = 0
+
+
+class DiscoveryFileCache(Cache):
+    """Discovery document cache stored in files on the local disk, shared between processes.
+
+    Args:
+        cache_dir (str): Directory to store discovery documents in
+        ttl (int): Number of seconds a cached document remains valid
+    """
+
+    def __init__(self, cache_dir=DISCOVERY_CACHE_DIR, ttl=86400):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                with open(path, encoding='utf-8') as file:
+                    return file.read()
+        except OSError:
+            pass
+        return None
+
+    def set(self, url, content):
+        path = self._path(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as file:
+                file.write(content)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+
+def authorize_from_cache(credentials, keyfile_path, scopes, token_cache):
+    """Give credentials an access token from a token cache, if one is used.
+
+    :param credentials: Credentials built from the keyfile
+    :param keyfile_path: Path to client_secrets.json
+    :param scopes: OAuth scopes the credentials were built with
+    :param token_cache: gapandas.tokens.TokenCache, True for the default one, or None to use no cache
+    """
+
+    if token_cache is None or token_cache is False:
+        return
+
+    if token_cache is True:
+        token_cache = tokens.get_default_cache()
+
+    token_cache.authorize(credentials, keyfile_path, scopes)
+
+
+def build_service(credentials, timeout=DEFAULT_TIMEOUT):
+    """Build an Analytics v3 service object without fetching the discovery document over the network.
+
+    The discovery document bundled with google-api-python-client is used. If it is not available, the document is
+    downloaded once and kept in a DiscoveryFileCache.
+
+    :param credentials: Credentials to authorise requests with
+    :param timeout: Socket timeout in seconds for requests made through the service
+    :return: Google Analytics service object
+    """
+
+    http = authorize_http(credentials, timeout)
+
+    try:
+        return build("analytics", "v3", http=http, static_discovery=True)
+    except UnknownApiNameOrVersion:
+        return build("analytics", "v3", http=http, static_discovery=False, cache=DiscoveryFileCache())
+
+
+def set_http_timeout(http, timeout):
+    """Set the socket timeout of an HTTP transport, including its open keep-alive connections.
+
+    :param http: Authorised httplib2.Http transport
+    :param timeout: Socket timeout in seconds, or None to wait indefinitely
+    """
+
+    # google-auth transports wrap the httplib2.Http
+    http = getattr(http, 'http', http)
+    http.timeout = timeout
+
+    for connection in http.connections.values():
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+
+@contextmanager
+def request_timeout(http, timeout):
+    """Override the socket timeout of an HTTP transport for the duration of a with block.
+
+    :param http: Authorised httplib2.Http transport
+    :param timeout: Socket timeout in seconds, or None to keep the transport's own timeout
+    """
+
+    if timeout is None:
+        yield
+        return
+
+    previous = getattr(http, 'http', http).timeout
+    set_http_timeout(http, timeout)
+    try:
+        yield
+    finally:
+        set_http_timeout(http, previous)
+
+
+def get_service(keyfile_path, verbose=False, rate_limiter=None, scopes=SCOPES, reuse=True, token_cache=None,
+                timeout=DEFAULT_TIMEOUT):
     """Return a service to communicate with the Google Analytics API
        using settings from the configuration file.
 
+    Services are memoised per thread, keyed by all the arguments that affect the service, so calling get_service()
+    again in the same thread returns the service that was already built. Each thread gets its own service, because
+    a service's HTTP transport is not thread-safe. To share one service between threads, use a ServicePool.
+
     :param keyfile_path - Path to client_secrets.json
     :param verbose: Set to True to see messages
+    :param rate_limiter: Optional gapandas.ratelimit.RateLimiter shared by every request made through the service
+    :param scopes: OAuth scopes to request (default is read only access to Google Analytics)
+    :param reuse: Set to False to always build a new service
+    :param token_cache: Optional gapandas.tokens.TokenCache, or True for the default one, to share access tokens
+        with other processes using the same keyfile
+    :param timeout: Socket timeout in seconds for requests made through the service (default 500)
     """
 
     if verbose:
@@ -33,11 +171,22 @@ def get_service(keyfile_path, verbose=False):
 
     else:
 
+        key = (os.path.abspath(keyfile_path), scopes, timeout, rate_limiter, token_cache)
+        services = get_thread_services()
+
+        if reuse and key in services:
+            return services[key]
+
         try:
-            credentials = ServiceAccountCredentials.from_json_keyfile_name(keyfile_path,
-                                                                           scopes="https://www.googleapis.com/auth"
-                                                                                  "/analytics.readonly")
-            service = build("analytics", "v3", credentials=credentials)
+            credentials = ServiceAccountCredentials.from_json_keyfile_name(keyfile_path, scopes=scopes)
+            authorize_from_cache(credentials, keyfile_path, scopes, token_cache)
+            service = build_service(credentials, timeout)
+
+            if rate_limiter is not None:
+                ratelimit.set_rate_limiter(service, rate_limiter)
+
+            if reuse:
+                services[key] = service
 
             if verbose:
                 print('Connected successfully')
@@ -51,3 +200,160 @@ def get_service(keyfile_path, verbose=False):
                 Ensure your keyfile is correct and you have added the email to your Google Analytics account.')
 
             return e
+
+
+def get_thread_services():
+    """Return the dictionary of services memoised by get_service() in the current thread."""
+
+    if getattr(_local, 'generation', None) != _generation:
+        _local.services = {}
+        _local.generation = _generation
+
+    return _local.services
+
+
+def clear_services():
+    """Forget every service memoised by get_service(), in every thread."""
+
+    global _generation
+    _generation += 1
+
+
+class ServicePool:
+    """Thread-safe Google Analytics service for parallel workloads.
+
+    A single service object wraps one httplib2.Http, which must not be used by more than one thread at a time. A pool
+    shares one service and one set of credentials, including their token refreshes, but gives each request its own
+    authorised HTTP transport. Transports are reused, keeping their connections alive, and at most size are created,
+    so at most size requests are in flight at once. A pool can be passed to any gapandas.query function in place of
+    a service.
+
+    A pool can also wrap an existing service, sharing its credentials and rate limiter. gapandas.query does this
+    itself when a plain service is used with more than one worker.
+
+    Args:
+        keyfile_path (str): Path to client_secrets.json. Not used when service is set.
+        size (int, optional): Maximum number of HTTP transports, and so of concurrent requests (default 8)
+        scopes (str, optional): OAuth scopes to request (default is read only access to Google Analytics)
+        rate_limiter (object, optional): gapandas.ratelimit.RateLimiter shared by every request made through the pool
+        token_cache (object, optional): gapandas.tokens.TokenCache, or True for the default one, to share access
+            tokens with other processes using the same keyfile
+        timeout (float, optional): Socket timeout in seconds for requests made through the pool (default 500, or the
+            timeout of service)
+        service (object, optional): Existing service to share instead of building one from keyfile_path
+    """
+
+    def __init__(self, keyfile_path=None, size=8, scopes=SCOPES, rate_limiter=None, token_cache=None, timeout=None,
+                 service=None):
+        if service is not None:
+            self.credentials = get_credentials(service)
+            self.service = service
+            self.timeout = getattr(service._http, 'http', service._http).timeout if timeout is None else timeout
+            rate_limiter = rate_limiter or ratelimit.get_rate_limiter(service)
+        else:
+            self.credentials = ServiceAccountCredentials.from_json_keyfile_name(keyfile_path, scopes=scopes)
+            authorize_from_cache(self.credentials, keyfile_path, scopes, token_cache)
+            self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+            self.service = build_service(self.credentials, self.timeout)
+
+        self.size = size
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+        if rate_limiter is not None:
+            ratelimit.set_rate_limiter(self, rate_limiter)
+
+    def data(self):
+        """Return the data resource of the shared service, used to build requests."""
+
+        return self.service.data()
+
+    def new_batch_http_request(self, callback=None):
+        """Return a batch request object for the shared service."""
+
+        return self.service.new_batch_http_request(callback=callback)
+
+    @contextmanager
+    def http(self):
+        """Borrow an authorised HTTP transport for the duration of a with block, waiting if all are in use."""
+
+        self._slots.acquire()
+        try:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = authorize_http(self.credentials, self.timeout)
+
+            try:
+                yield http
+            finally:
+                self._idle.put(http)
+        finally:
+            self._slots.release()
+
+    def execute(self, request, timeout=None):
+        """Execute a request built from the pool's service on a borrowed HTTP transport and return the response.
+
+        :param request: googleapiclient HttpRequest or BatchHttpRequest
+        :param timeout: Optional socket timeout in seconds for this request, overriding the pool's timeout
+        :return: Response of the request
+        """
+
+        with self.http() as http, request_timeout(http, timeout):
+            return request.execute(http=http)
+
+
+def get_credentials(service):
+    """Return the credentials used by a service object or ServicePool.
+
+    :param service: Google Analytics service object returned by get_service()
+    :return: oauth2client or google-auth credentials
+    """
+
+    if isinstance(service, ServicePool):
+        return service.credentials
+
+    http = service._http
+
+    # google-auth transports keep their credentials, oauth2client attaches them to the wrapped request method
+    if hasattr(http, 'http'):
+        return http.credentials
+    return http.request.credentials
+
+
+def authorize_http(credentials, timeout=DEFAULT_TIMEOUT):
+    """Return a new HTTP transport authorised with credentials.
+
+    :param credentials: oauth2client or google-auth credentials
+    :param timeout: Socket timeout in seconds for requests made through the transport
+    :return: Authorised httplib2.Http transport
+    """
+
+    # oauth2client credentials, as created by get_service()
+    if hasattr(credentials, 'authorize'):
+        return credentials.authorize(httplib2.Http(timeout=timeout))
+
+    # google-auth credentials
+    from google_auth_httplib2 import AuthorizedHttp
+    return AuthorizedHttp(credentials, http=httplib2.Http(timeout=timeout))
+
+
+def get_access_token(service):
+    """Return a valid OAuth access token for the credentials used by a service object, refreshing it if expired.
+
+    :param service: Google Analytics service object returned by get_service()
+    :return: Access token string
+    """
+
+    credentials = get_credentials(service)
+
+    # oauth2client credentials, as created by get_service()
+    if hasattr(credentials, 'get_access_token'):
+        return credentials.get_access_token(httplib2.Http(timeout=DEFAULT_TIMEOUT)).access_token
+
+    # google-auth credentials
+    if not credentials.valid:
+        from google_auth_httplib2 import Request
+        credentials.refresh(Request(httplib2.Http(timeout=DEFAULT_TIMEOUT)))
+    return credentials.token
@@ -5,8 +5,32 @@ Date: June 8, 2020
 Description: Passes a payload to the Google Analytics reporting API and returns the data.
 """
 
+import asyncio
+import gzip
+import hashlib
+import json
 import math
+import os
+import random
+import re
+import shutil
+import socket
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextvars import ContextVar, copy_context
+from datetime import date, timedelta
+from itertools import islice
+import httplib2
+import numpy as np
 import pandas as pd
+from googleapiclient.errors import HttpError
+from gapandas import connect
+from gapandas import ratelimit
+
+# Per-request timeout and hedging settings of the running run_query() call, inherited by its worker threads
+_request_timeout = ContextVar('gapandas_request_timeout', default=None)
+_hedge_after = ContextVar('gapandas_hedge_after', default=None)
 
 
 def show_message(verbose, message):
@@ -28,15 +52,151 @@ def run_query(service: object,
               view_id: str,
               payload: dict,
               output: str = 'df',
-              verbose=False):
+              verbose=False,
+              workers: int = 1,
+              categorical: bool = False,
+              cache=None,
+              partition: str = None,
+              freshness_days: int = 3,
+              partition_workers: int = 1,
+              checkpoint_dir: str = None,
+              timeout: float = None,
+              hedge_after: float = None):
     """Runs a query against the Google Analytics reporting API and returns the results data.
 
+    Args:
+        service (object): Authenticated Google Analytics service connection
+        view_id (int): Google Analytics view ID to query
+        payload (dict): Payload of query parameters to pass to Google Analytics in Python dictionary
+        output (str): String containing the format to return (df, raw or arrow). The arrow format returns a
+            PyArrow Table and requires the optional pyarrow package.
+        verbose (bool): Turn on verbose messages.
+        workers (int): Number of result pages to fetch concurrently (default 1)
+        categorical (bool): Return dimension columns as Pandas Categoricals to reduce memory use (default False)
+        cache (object, optional): Result cache, such as gapandas.cache.SQLiteCache, checked before calling the API
+        partition (str, optional): Query each day, week or month of the date range separately, which reduces
+            sampling on long date ranges. With a cache, partitions older than freshness_days are cached permanently
+            and only the recent tail is fetched again. Set to auto to split the date range in half repeatedly
+            until no part is sampled (see get_adaptive_results()); the cache is not used in this mode.
+        freshness_days (int): Number of days after which data is treated as final when partitioning (default 3)
+        partition_workers (int): Number of partitions to fetch concurrently (default 1)
+        checkpoint_dir (str, optional): Spool directory in which each fetched page is saved, so that an interrupted
+            query skips the pages it already has when run again
+        timeout (float, optional): Socket timeout in seconds for each API request, overriding the service's timeout.
+            httplib2 applies the same timeout to connecting and to each read.
+        hedge_after (float, optional): Send a second copy of any request that has not returned after this many
+            seconds and use whichever response arrives first. Requires a connect.ServicePool as the service.
+
+    Returns:
+         Pandas dataframe, raw array or PyArrow Table
+    """
+
+    if hedge_after is not None and not isinstance(service, connect.ServicePool):
+        raise ValueError('hedge_after requires a connect.ServicePool as the service')
+
+    required_payload = {'ids': 'ga:' + view_id}
+    final_payload = {**required_payload, **payload}
+    timeout_token = _request_timeout.set(timeout)
+    hedge_token = _hedge_after.set(hedge_after)
+
+    try:
+        if output == 'arrow' and cache is None and partition is None:
+            return pages_to_arrow(iter_pages(service, final_payload, workers=workers, checkpoint_dir=checkpoint_dir))
+
+        if partition == 'auto':
+            results = get_adaptive_results(service, final_payload, workers=workers,
+                                           partition_workers=partition_workers, checkpoint_dir=checkpoint_dir)
+        elif partition is not None:
+            results = get_partitioned_results(service, final_payload, partition, cache=cache,
+                                              freshness_days=freshness_days, workers=workers,
+                                              partition_workers=partition_workers, checkpoint_dir=checkpoint_dir)
+        elif cache is not None:
+            results = get_cached_results(service, final_payload, cache, workers=workers, checkpoint_dir=checkpoint_dir)
+        else:
+            results = get_results(service, final_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+        show_message(verbose, results)
+
+        if output == 'df':
+            return results_to_pandas(results, categorical=categorical)
+        elif output == 'arrow':
+            return results_to_arrow(results)
+        else:
+            return results
+
+    except Exception as e:
+        print('Query failed:', str(e))
+
+    finally:
+        _request_timeout.reset(timeout_token)
+        _hedge_after.reset(hedge_token)
+
+
+def run_query_iter(service: object,
+                   view_id: str,
+                   payload: dict,
+                   output: str = 'df',
+                   verbose=False,
+                   workers: int = 1,
+                   categorical: bool = False,
+                   checkpoint_dir: str = None):
+    """Runs a query against the Google Analytics reporting API and yields the results one page at a time.
+
+    Each page is yielded as soon as it arrives, so callers can write it to disk or a database and discard it before
+    the next page is held in memory. Unlike run_query, errors are raised rather than printed, so a failed page cannot
+    silently truncate an export.
+
+    Args:
+        service (object): Authenticated Google Analytics service connection
+        view_id (int): Google Analytics view ID to query
+        payload (dict): Payload of query parameters to pass to Google Analytics in Python dictionary
+        output (str): String containing the format to yield for each page (df or raw)
+        verbose (bool): Turn on verbose messages.
+        workers (int): Number of result pages to fetch ahead concurrently (default 1)
+        categorical (bool): Return dimension columns as Pandas Categoricals. Categories are shared across pages, so a
+            value keeps the same category code on every page it appears on (default False)
+        checkpoint_dir (str, optional): Spool directory in which each fetched page is saved, so that an interrupted
+            export skips the pages it already has when run again
+
+    Returns:
+         Generator of Pandas dataframes or raw page results
+    """
+
+    required_payload = {'ids': 'ga:' + view_id}
+    final_payload = {**required_payload, **payload}
+    categories = {}
+
+    for page_number, page in enumerate(iter_pages(service, final_payload, workers=workers,
+                                                                checkpoint_dir=checkpoint_dir), start=1):
+        show_message(verbose, 'Fetched page ' + str(page_number))
+
+        if output == 'df':
+            df = results_to_pandas(page, categorical=categorical, categories=categories)
+            if df is not None:
+                yield df
+        else:
+            yield page
+
+
+async def run_query_async(service: object,
+                          view_id: str,
+                          payload: dict,
+                          output: str = 'df',
+                          verbose=False,
+                          max_concurrency: int = 10,
+                          session=None,
+                          categorical: bool = False):
+    """Runs a query against the Google Analytics reporting API without blocking the event loop and returns the results
+    data. Requires the optional aiohttp package.
+
     Args:
         service (object): Authenticated Google Analytics service connection
         view_id (int): Google Analytics view ID to query
         payload (dict): Payload of query parameters to pass to Google Analytics in Python dictionary
         output (str): String containing the format to return (df or raw)
         verbose (bool): Turn on verbose messages.
+        max_concurrency (int): Maximum number of page requests in flight at once (default 10)
+        session (object, optional): aiohttp.ClientSession to reuse. A new session is created if not set.
+        categorical (bool): Return dimension columns as Pandas Categoricals to reduce memory use (default False)
 
     Returns:
          Pandas dataframe or raw array
@@ -46,11 +206,11 @@ def run_query(service: object,
     final_payload = {**required_payload, **payload}
 
     try:
-        results = get_results(service, final_payload)
+        results = await get_results_async(service, final_payload, max_concurrency=max_concurrency, session=session)
         show_message(verbose, results)
 
         if output == 'df':
-            return results_to_pandas(results)
+            return results_to_pandas(results, categorical=categorical)
         else:
             return results
 
@@ -58,6 +218,317 @@ def run_query(service: object,
         print('Query failed:', str(e))
 
 
+def run_query_many(service: object,
+                   view_ids: list,
+                   payload: dict,
+                   output: str = 'df',
+                   verbose=False,
+                   view_workers: int = 8,
+                   workers: int = 1,
+                   categorical: bool = False,
+                   executor: str = 'thread',
+                   keyfile_path: str = None):
+    """Runs the same query against several Google Analytics views concurrently.
+
+    A failing view does not stop the others. Its error is recorded in the report, which also gives the time taken,
+    number of rows and number of API calls for each view. A plain service is wrapped in a connect.ServicePool, so
+    that each thread has its own HTTP transport.
+
+    With executor='process' each view is queried in a separate worker process, so converting the results to a
+    dataframe uses all CPU cores instead of being limited by the GIL. Services cannot be pickled, so each worker
+    process builds its own from keyfile_path the first time it needs one and reuses it for later views. Results are
+    sent back as Arrow IPC buffers, which requires the optional pyarrow package.
+
+    Args:
+        service (object): Authenticated Google Analytics service connection. Not used when executor is process.
+        view_ids (list): Google Analytics view IDs to query
+        payload (dict): Payload of query parameters to pass to Google Analytics in Python dictionary
+        output (str): String containing the format to return (df for a single dataframe with a view_id column, or
+            dict for a dictionary of dataframes keyed by view ID)
+        verbose (bool): Turn on verbose messages.
+        view_workers (int): Number of views to query concurrently (default 8)
+        workers (int): Number of result pages to fetch concurrently for each view (default 1)
+        categorical (bool): Return dimension columns as Pandas Categoricals to reduce memory use (default False)
+        executor (str): Run views on worker threads (thread) or worker processes (process)
+        keyfile_path (str, optional): Path to client_secrets.json, required when executor is process
+
+    Returns:
+         Tuple of the results (Pandas dataframe or dictionary of dataframes) and a Pandas dataframe report
+    """
+
+    view_ids = [str(view_id) for view_id in view_ids]
+
+    if executor == 'process':
+        if keyfile_path is None:
+            raise ValueError('keyfile_path is required when executor is process')
+        if not os.path.exists(keyfile_path):
+            raise FileNotFoundError('Keyfile not found: ' + str(keyfile_path))
+
+        import pyarrow as pa
+
+        # Forked workers must not reuse the parent's memoised services, which share its open connections
+        with ProcessPoolExecutor(max_workers=view_workers, initializer=connect.clear_services) as pool:
+            futures = [pool.submit(query_view_process, keyfile_path, view_id, payload, workers, categorical)
+                       for view_id in view_ids]
+            outcomes = [future.result() for future in futures]
+
+        outcomes = [(None if buffer is None else arrow_to_pandas(pa.ipc.open_stream(buffer).read_all()), report)
+                    for buffer, report in outcomes]
+
+    elif executor == 'thread':
+        service = get_shared_service(service, view_workers * workers)
+
+        def query_thread(view_id):
+            return query_view(service, view_id, payload, workers, categorical)
+
+        with ThreadPoolExecutor(max_workers=view_workers) as pool:
+            outcomes = map_in_context(pool, query_thread, view_ids)
+
+    else:
+        raise ValueError('executor must be thread or process')
+
+    for df, view_report in outcomes:
+        show_message(verbose, 'View ' + view_report['view_id'] + ': ' +
+                     (view_report['error'] or str(view_report['rows']) + ' rows'))
+
+    report = pd.DataFrame([report for df, report in outcomes])
+    frames = {view_id: df for view_id, (df, view_report) in zip(view_ids, outcomes) if df is not None}
+
+    if output == 'dict':
+        return frames, report
+
+    if frames:
+        data = pd.concat([df.assign(view_id=view_id) for view_id, df in frames.items()], ignore_index=True)
+    else:
+        data = pd.DataFrame()
+
+    return data, report
+
+
+def query_view(service, view_id, payload, workers=1, categorical=False):
+    """Run a query against one view for run_query_many(), recording any error instead of raising it.
+
+    :param service: Authenticated Google Analytics service connection
+    :param view_id: Google Analytics view ID, without the ga: prefix
+    :param payload: Payload of query parameters
+    :param workers: Number of result pages to fetch concurrently
+    :param categorical: Return dimension columns as Pandas Categoricals
+    :return: Tuple of the Pandas dataframe, or None, and a dictionary reporting on the query
+    """
+
+    started = time.perf_counter()
+    report = {'view_id': view_id, 'seconds': None, 'rows': 0, 'apiCalls': 0, 'error': None}
+    df = None
+
+    try:
+        results = get_results(service, {'ids': 'ga:' + view_id, **payload}, workers=workers)
+        df = results_to_pandas(results, categorical=categorical)
+        report['apiCalls'] = get_api_calls(results)
+        report['rows'] = 0 if df is None else len(df)
+    except Exception as e:
+        report['error'] = str(e)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return df, report
+
+
+def query_view_process(keyfile_path, view_id, payload, workers=1, categorical=False):
+    """Run query_view() in a worker process started by run_query_many(executor='process').
+
+    The service is built from the keyfile on the first call in each process and memoised by connect.get_service()
+    for later calls. The dataframe is returned as an Arrow IPC stream, which is cheaper to send between processes
+    than a pickled dataframe.
+
+    :param keyfile_path: Path to client_secrets.json
+    :param view_id: Google Analytics view ID, without the ga: prefix
+    :param payload: Payload of query parameters
+    :param workers: Number of result pages to fetch concurrently
+    :param categorical: Return dimension columns as Pandas Categoricals
+    :return: Tuple of the Arrow IPC stream bytes, or None, and a dictionary reporting on the query
+    """
+
+    import pyarrow as pa
+
+    # get_service() exits the process when the keyfile is missing, which would abort the whole pool
+    if not os.path.exists(keyfile_path):
+        service = FileNotFoundError('Keyfile not found: ' + str(keyfile_path))
+    else:
+        service = connect.get_service(keyfile_path)
+
+    if isinstance(service, Exception):
+        return None, {'view_id': view_id, 'seconds': 0, 'rows': 0, 'apiCalls': 0, 'error': str(service)}
+
+    df, report = query_view(service, view_id, payload, workers, categorical)
+    if df is None:
+        return None, report
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes(), report
+
+
+def run_query_batch(service: object,
+                    queries: dict,
+                    output: str = 'df',
+                    verbose=False,
+                    batch_size: int = 10,
+                    categorical: bool = False):
+    """Runs many small queries using batch HTTP requests, which send several API requests in a single HTTP call.
+
+    This suits queries that return a single page. Queries with more pages have their remaining pages fetched
+    individually afterwards. Queries that fail with a transient error, including those in a batch request that fails
+    as a whole, are retried individually.
+
+    Args:
+        service (object): Authenticated Google Analytics service connection
+        queries (dict): Dictionary of queries, keyed by any name, each a tuple of (view_id, payload)
+        output (str): String containing the format to return for each query (df or raw)
+        verbose (bool): Turn on verbose messages.
+        batch_size (int): Maximum number of queries sent in each batch request (default 10)
+        categorical (bool): Return dimension columns as Pandas Categoricals to reduce memory use (default False)
+
+    Returns:
+         Dictionary of Pandas dataframes or raw arrays with the same keys as queries. Failed queries are None.
+    """
+
+    final_payloads = {key: {'ids': 'ga:' + str(view_id), **payload} for key, (view_id, payload) in queries.items()}
+    responses = {}
+    keys = list(final_payloads)
+    limiter = ratelimit.get_rate_limiter(service)
+
+    def callback(request_id, response, exception):
+        responses[keys[int(request_id)]] = exception if exception is not None else response
+
+    for start in range(0, len(keys), batch_size):
+        batch = service.new_batch_http_request(callback=callback)
+
+        for i in range(start, min(start + batch_size, len(keys))):
+            if limiter is not None:
+                limiter.acquire(final_payloads[keys[i]].get('ids'))
+            batch.add(service.data().ga().get(**final_payloads[keys[i]]), request_id=str(i))
+
+        try:
+            if isinstance(service, connect.ServicePool):
+                service.execute(batch)
+            else:
+                batch.execute()
+        except Exception as e:
+            # The whole batch failed, so every query in it without a response is retried or reported individually
+            for key in keys[start:start + batch_size]:
+                responses.setdefault(key, e)
+
+        # Retried once the batch has finished, as a pool's transport is still held while the callbacks run
+        for key in keys[start:start + batch_size]:
+            if isinstance(responses[key], Exception) and is_retryable_error(responses[key]):
+                try:
+                    responses[key] = execute_query(service, final_payloads[key])
+                    responses[key]['apiCalls'] += 1
+                except Exception as e:
+                    responses[key] = e
+
+    output_results = {}
+    for key in keys:
+        try:
+            if isinstance(responses[key], Exception):
+                raise responses[key]
+
+            results = responses[key]
+            start_indexes = get_start_indexes(results)
+            results = collect_pages(results, (get_page(service, final_payloads[key], start_index)
+                                              for start_index in start_indexes))
+            show_message(verbose, results)
+
+            if output == 'df':
+                output_results[key] = results_to_pandas(results, categorical=categorical)
+            else:
+                output_results[key] = results
+
+        except Exception as e:
+            print('Query failed:', str(e))
+            output_results[key] = None
+
+    return output_results
+
+
+def refresh_query(service: object,
+                  view_id: str,
+                  payload: dict,
+                  previous,
+                  lookback: int = 3,
+                  verbose=False,
+                  workers: int = 1):
+    """Incrementally refresh the results of a date-dimensioned query, fetching only new periods.
+
+    The newest period in the previous results, plus lookback earlier periods, is treated as possibly incomplete.
+    Those periods are fetched again along with any newer ones, and the previous rows for them are replaced.
+
+    Args:
+        service (object): Authenticated Google Analytics service connection
+        view_id (int): Google Analytics view ID to query
+        payload (dict): Payload of query parameters. Its dimensions must include ga:date, ga:yearMonth or ga:dateHour.
+        previous (dataframe or str): Previously materialised results, or the path to a Parquet file of them. A
+            Parquet file is overwritten with the refreshed results.
+        lookback (int): Number of periods (days, or months for ga:yearMonth) before the newest one to fetch again to
+            pick up late-arriving data (default 3)
+        verbose (bool): Turn on verbose messages.
+        workers (int): Number of result pages to fetch concurrently (default 1)
+
+    Returns:
+         Pandas dataframe
+    """
+
+    path = previous if isinstance(previous, str) else None
+    if path:
+        previous = pd.read_parquet(path)
+
+    dimensions = split_fields(payload.get('dimensions', ''))
+    period = next((dimension.replace('ga:', '') for dimension in ('ga:date', 'ga:dateHour', 'ga:yearMonth')
+                   if dimension in dimensions), None)
+    if period is None:
+        raise ValueError('Incremental refresh requires a ga:date, ga:dateHour or ga:yearMonth dimension')
+
+    required_payload = {'ids': 'ga:' + view_id}
+    final_payload = {**required_payload, **payload}
+
+    if len(previous):
+        # Find the start of the first period to fetch again
+        if period == 'date':
+            restart = previous['date'].max().date() - timedelta(days=lookback)
+        elif period == 'dateHour':
+            restart = pd.to_datetime(previous['dateHour'].astype(str).max()[:8]).date() - timedelta(days=lookback)
+        else:
+            restart = (pd.Period(previous['yearMonth'].astype(str).max(), freq='M') - lookback).start_time.date()
+
+        # Previous rows are kept only before the date actually fetched from, which is later if the payload starts later
+        start = max(restart, date.fromisoformat(resolve_date(final_payload['start_date'])))
+        final_payload['start_date'] = start.isoformat()
+
+        if period == 'date':
+            keep = previous['date'] < pd.Timestamp(start)
+        elif period == 'dateHour':
+            keep = previous['dateHour'].astype(str) < start.strftime('%Y%m%d')
+        else:
+            keep = previous['yearMonth'].astype(str) < start.strftime('%Y%m')
+        previous = previous[keep]
+
+    show_message(verbose, 'Refreshing from ' + str(final_payload['start_date']))
+    results = get_results(service, final_payload, workers=workers)
+    df = results_to_pandas(results)
+
+    if df is not None:
+        df = pd.concat([previous, df], ignore_index=True)
+    else:
+        df = previous.reset_index(drop=True)
+
+    if path:
+        df.to_parquet(path, index=False)
+
+    return df
+
+
 def get_profile_info(results):
     """Return the profileInfo object from a Google Analytics API request. This contains various parameters, including
     the profile ID, the query parameters, the link used in the API call, the number of results and the pagination.
@@ -136,6 +607,192 @@ def get_column_headers(results):
         return results['columnHeaders']
 
 
+INTEGER_COLUMNS = ['sessionCount', 'daysSinceLastSession', 'userBucket', 'users', 'newUsers', '1dayUsers',
+                   '7dayUsers', '14dayUsers', '28dayUsers', '30dayUsers', 'sessionDurationBucket', 'sessions',
+                   'bounces', 'uniqueDimensionCombinations', 'hits', 'organicSearches', 'impressions', 'adclicks',
+                   'goal1Starts', 'goal2Starts', 'goal3Starts', 'goal4Starts', 'goal5Starts', 'goal6Starts',
+                   'goal7Starts', 'goal8Starts', 'goal9Starts', 'goal10Starts', 'goal11Starts', 'goal12Starts',
+                   'goal13Starts', 'goal14Starts', 'goal15Starts', 'goal16Starts', 'goal17Starts', 'goal18Starts',
+                   'goal19Starts', 'goal20Starts', 'goal1Completions', 'goal2Completions', 'goal3Completions',
+                   'goal4Completions', 'goal5Completions', 'goal6Completions', 'goal7Completions', 'goal8Completions',
+                   'goal9Completions', 'goal10Completions', 'goal11Completions', 'goal12Completions',
+                   'goal13Completions', 'goal14Completions', 'goal15Completions', 'goal16Completions',
+                   'goal17Completions', 'goal18Completions', 'goal19Completions', 'goal20Completions',
+                   'goalCompletionsAll', 'goalStartsAll', 'goal1Abandons', 'goal2Abandons', 'goal3Abandons',
+                   'goal4Abandons', 'goal5Abandons', 'goal6Abandons', 'goal7Abandons', 'goal8Abandons',
+                   'goal9Abandons', 'goal10Abandons', 'goal11Abandons', 'goal12Abandons', 'goal13Abandons',
+                   'goal14Abandons', 'goal15Abandons', 'goal16Abandons', 'goal17Abandons', 'goal18Abandons',
+                   'goal19Abandons', 'goal20Abandons', 'goalAbandonsAll', 'pageDepth', 'entrances', 'pageviews',
+                   'uniquePageviews', 'exits', 'searchResultViews', 'searchUniques', 'searchSessions', 'searchDepth',
+                   'searchRefinements', 'searchExits', 'pageLoadTime', 'pageLoadSample', 'domainLookupTime',
+                   'pageDownloadTime', 'redirectionTime', 'serverConnectionTime', 'serverResponseTime',
+                   'speedMetricsSample', 'domInteractiveTime', 'domContentLoadedTime', 'domLatencyMetricsSample',
+                   'screenviews', 'uniqueScreenviews', 'sessionsWithEvent', 'sessionsToTransaction',
+                   'daysToTransaction', 'transactions', 'itemQuantity', 'uniquePurchases', 'internalPromotionClicks',
+                   'internalPromotionViews', 'productAddsToCart', 'productCheckouts', 'productDetailViews',
+                   'productListClicks', 'productListViews', 'productRefunds', 'productRemovesFromCart',
+                   'quantityAddedToCart', 'quantityCheckedOut', 'quantityRefunded', 'quantityRemovedFromCart',
+                   'totalRefunds', 'socialInteractions', 'uniqueSocialInteractions', 'userTimingValue',
+                   'userTimingSample', 'exceptions', 'fatalExceptions', 'customMetric1', 'customMetric2',
+                   'customMetric3', 'customMetric4', 'customMetric5', 'customMetric6', 'customMetric7',
+                   'customMetric8', 'customMetric9', 'customMetric10', 'customMetric11', 'customMetric12',
+                   'customMetric13', 'customMetric14', 'customMetric15', 'customMetric16', 'customMetric17',
+                   'customMetric18', 'customMetric19', 'customMetric20', 'year', 'month', 'week', 'day', 'hour',
+                   'minute', 'nthMonth', 'nthWeek', 'nthDay', 'nthMinute', 'dayOfWeek', 'isoWeek', 'isoYear',
+                   'isoYearIsoWeek', 'nthHour', 'dcmFloodlightQuantity', 'dcmClicks', 'dcmImpressions',
+                   'adsenseAdUnitsViewed', 'adsenseAdsViewed', 'adsenseAdsClicks', 'adsensePageImpressions',
+                   'adsenseExits', 'totalPublisherImpressions', 'totalPublisherMonetizedPageviews',
+                   'totalPublisherClicks', 'backfillImpressions', 'backfillMonetizedPageviews', 'backfillClicks',
+                   'dfpImpressions', 'dfpMonetizedPageviews', 'dfpClicks', 'cohortNthDay', 'cohortNthMonth',
+                   'cohortNthWeek', 'cohortActiveUsers', 'cohortTotalUsers', 'cohortTotalUsersWithLifetimeCriteria',
+                   'dbmClicks', 'dbmConversions', 'dbmImpressions', 'dsCost', 'dsImpressions'
+                   ]
+
+FLOAT_COLUMNS = ['percentNewSessions', 'sessionsPerUser', 'bounceRate', 'adCost', 'CPM', 'CPC', 'CTR',
+                 'costPerTransaction', 'costPerGoalConversion', 'RPC', 'ROAS', 'goal1Value', 'goal2Value',
+                 'goal3Value', 'goal4Value', 'goal5Value', 'goal6Value', 'goal7Value', 'goal8Value', 'goal9Value',
+                 'goal10Value', 'goal11Value', 'goal12Value', 'goal13Value', 'goal14Value', 'goal15Value',
+                 'goal16Value', 'goal17Value', 'goal18Value', 'goal19Value', 'goal20Value', 'goalValueAll',
+                 'goalValuePerSession', 'goal1ConversionRate', 'goal2ConversionRate', 'goal3ConversionRate',
+                 'goal4ConversionRate', 'goal5ConversionRate', 'goal6ConversionRate', 'goal7ConversionRate',
+                 'goal8ConversionRate', 'goal9ConversionRate', 'goal10ConversionRate', 'goal11ConversionRate',
+                 'goal12ConversionRate', 'goal13ConversionRate', 'goal14ConversionRate', 'goal15ConversionRate',
+                 'goal16ConversionRate', 'goal17ConversionRate', 'goal18ConversionRate', 'goal19ConversionRate',
+                 'goal20ConversionRate', 'goalConversionRateAll', 'goal1AbandonRate', 'goal2AbandonRate',
+                 'goal3AbandonRate', 'goal4AbandonRate', 'goal5AbandonRate', 'goal6AbandonRate', 'goal7AbandonRate',
+                 'goal8AbandonRate', 'goal9AbandonRate', 'goal10AbandonRate', 'goal11AbandonRate',
+                 'goal12AbandonRate', 'goal13AbandonRate', 'goal14AbandonRate', 'goal15AbandonRate',
+                 'goal16AbandonRate', 'goal17AbandonRate', 'goal18AbandonRate', 'goal19AbandonRate',
+                 'goal20AbandonRate', 'goalAbandonRateAll', 'latitude', 'longitude', 'pageValue', 'entranceRate',
+                 'pageviewsPerSession', 'exitRate', 'avgSearchResultViews', 'percentSessionsWithSearch',
+                 'avgSearchDepth', 'percentSearchRefinements', 'searchExitRate', 'searchGoalConversionRateAll',
+                 'goalValueAllPerSearch', 'searchGoal1ConversionRate', 'searchGoal2ConversionRate',
+                 'searchGoal3ConversionRate', 'searchGoal4ConversionRate', 'searchGoal5ConversionRate',
+                 'searchGoal6ConversionRate', 'searchGoal7ConversionRate', 'searchGoal8ConversionRate',
+                 'searchGoal9ConversionRate', 'searchGoal10ConversionRate', 'searchGoal11ConversionRate',
+                 'searchGoal12ConversionRate', 'searchGoal13ConversionRate', 'searchGoal14ConversionRate',
+                 'searchGoal15ConversionRate', 'searchGoal16ConversionRate', 'searchGoal17ConversionRate',
+                 'searchGoal18ConversionRate', 'searchGoal19ConversionRate', 'searchGoal20ConversionRate',
+                 'avgPageLoadTime', 'avgDomainLookupTime', 'avgPageDownloadTime', 'avgRedirectionTime',
+                 'avgServerConnectionTime', 'avgServerResponseTime', 'avgDomInteractiveTime',
+                 'avgDomContentLoadedTime', 'avgDomLatencyMetricsSample', 'screenviewsPerSession',
+                 'avgScreenviewDuration', 'eventValue', 'eventsPerSessionWithEvent', 'transactionsPerSession',
+                 'transactionRevenue', 'revenuePerTransaction', 'transactionRevenuePerSession', 'transactionShipping',
+                 'transactionTax', 'totalValue', 'revenuePerItem', 'itemRevenue', 'itemsPerPurchase',
+                 'localTransactionRevenue', 'localTransactionShipping', 'localTransactionTax', 'localItemRevenue',
+                 'buyToDetailRate', 'cartToDetailRate', 'internalPromotionCTR', 'localProductRefundAmount',
+                 'localRefundAmount', 'productListCTR', 'productRefundAmount', 'productRevenuePerPurchase',
+                 'refundAmount', 'revenuePerUser', 'transactionsPerUser', 'socialInteractionsPerSession',
+                 'avgUserTimingValue', 'exceptionsPerScreenview', 'fatalExceptionsPerScreenview',
+                 'dcmFloodlightRevenue', 'dcmCPC', 'dcmCTR', 'dcmCost', 'dcmROAS', 'dcmRPC', 'adsenseRevenue',
+                 'adsenseCTR', 'adsenseECPM', 'adsenseViewableImpressionPercent', 'adsenseCoverage',
+                 'totalPublisherCoverage', 'totalPublisherImpressionsPerSession', 'totalPublisherECPM',
+                 'totalPublisherViewableImpressionsPercent', 'totalPublisherCTR', 'totalPublisherRevenue',
+                 'totalPublisherRevenuePer1000Sessions', 'adxImpressions', 'adxMonetizedPageviews', 'adxClicks',
+                 'adxCoverage', 'adxImpressionsPerSession', 'adxViewableImpressionsPercent', 'adxCTR', 'adxRevenue',
+                 'adxRevenuePer1000Sessions', 'adxECPM', 'backfillCoverage', 'backfillImpressionsPerSession',
+                 'backfillViewableImpressionsPercent', 'backfillCTR', 'backfillRevenue', 'backfillECPM',
+                 'backfillRevenuePer1000Sessions', 'dfpCoverage', 'dfpImpressionsPerSession',
+                 'dfpViewableImpressionsPercent', 'dfpCTR', 'dfpRevenue', 'dfpRevenuePer1000Sessions', 'dfpECPM',
+                 'cohortAppviewsPerUser', 'cohortAppviewsPerUserWithLifetimeCriteria', 'cohortGoalCompletionsPerUser',
+                 'cohortGoalCompletionsPerUserWithLifetimeCriteria', 'cohortPageviewsPerUser',
+                 'cohortPageviewsPerUserWithLifetimeCriteria', 'cohortRetentionRate', 'cohortRevenuePerUser',
+                 'cohortRevenuePerUserWithLifetimeCriteria', 'cohortSessionDurationPerUser',
+                 'cohortSessionDurationPerUserWithLifetimeCriteria', 'cohortSessionsPerUser',
+                 'cohortSessionsPerUserWithLifetimeCriteria', 'dbmCPA', 'dbmCPC', 'dbmCPM', 'dbmCTR', 'dbmCost',
+                 'dbmROAS', 'dsCPC', 'dsCTR', 'dsProfit', 'dsReturnOnAdSpend', 'dsRevenuePerClick'
+                 ]
+
+STRING_COLUMNS = ['userType', 'userDefinedValue', 'referralPath', 'fullReferrer', 'campaign', 'source', 'medium',
+                  'sourceMedium', 'keyword', 'adContent', 'socialNetwork', 'hasSocialSourceReferral',
+                  'campaignCode', 'adGroup', 'adSlot', 'adDistributionNetwork', 'adMatchType',
+                  'adKeywordMatchType', 'adMatchedQuery', 'adPlacementDomain', 'adPlacementUrl', 'adFormat',
+                  'adTargetingType', 'adTargetingOption', 'adDisplayUrl', 'adDestinationUrl',
+                  'adwordsCustomerID', 'adwordsCampaignID', 'adwordsAdGroupID', 'adwordsCreativeID',
+                  'adwordsCriteriaID', 'adQueryWordCount', 'isTrueViewVideoAd', 'goalCompletionLocation',
+                  'goalPreviousStep1', 'goalPreviousStep2', 'goalPreviousStep3', 'browser', 'browserVersion',
+                  'operatingSystem', 'operatingSystemVersion', 'mobileDeviceBranding', 'mobileDeviceModel',
+                  'mobileDeviceInputSelector', 'mobileDeviceInfo', 'mobileDeviceMarketingName', 'deviceCategory',
+                  'browserSize', 'dataSource', 'continent', 'subContinent', 'country', 'region', 'metro', 'city',
+                  'networkDomain', 'cityId', 'continentId', 'countryIsoCode', 'metroId', 'regionId', 'regionIsoCode',
+                  'subContinentCode', 'flashVersion', 'javaEnabled', 'language', 'screenColors',
+                  'sourcePropertyDisplayName', 'sourcePropertyTrackingId', 'screenResolution', 'hostname', 'pagePath',
+                  'pagePathLevel1', 'pagePathLevel2', 'pagePathLevel3', 'pagePathLevel4', 'pageTitle',
+                  'landingPagePath', 'secondPagePath', 'exitPagePath', 'previousPagePath', 'searchUsed',
+                  'searchKeyword', 'searchKeywordRefinement', 'searchCategory', 'searchStartPage',
+                  'searchDestinationPage', 'searchAfterDestinationPage', 'appInstallerId', 'appVersion', 'appName',
+                  'appId', 'screenName', 'screenDepth', 'landingScreenName', 'exitScreenName', 'eventCategory',
+                  'eventAction', 'eventLabel', 'transactionId', 'affiliation', 'productSku', 'productName',
+                  'productCategory', 'currencyCode', 'checkoutOptions', 'internalPromotionCreative',
+                  'internalPromotionId', 'internalPromotionName', 'internalPromotionPosition', 'orderCouponCode',
+                  'productBrand', 'productCategoryHeirarchy', 'productCouponCode', 'productListName',
+                  'productListPosition', 'productVariant', 'shoppingStage', 'socialInteractionNetwork',
+                  'socialInteractionAction', 'socialInteractionNetworkAction', 'socialInteractionTarget',
+                  'socialEngagementType', 'userTimingCategory', 'userTimingLabel', 'userTimingVariable',
+                  'exceptionDescription', 'experimentId', 'experimentVariant', 'experimentCombination',
+                  'experimentName', 'customVarName1', 'customVarName2', 'customVarName3', 'customVarName4',
+                  'customVarName5', 'customVarName6', 'customVarName7', 'customVarName8', 'customVarName9',
+                  'customVarName10', 'customVarName11', 'customVarName12', 'customVarName13', 'customVarName14',
+                  'customVarName15', 'customVarName16', 'customVarName17', 'customVarName18', 'customVarName19',
+                  'customVarName20', 'customVarValue1', 'customVarValue2', 'customVarValue3', 'customVarValue4',
+                  'customVarValue5', 'customVarValue6', 'customVarValue7', 'customVarValue8', 'customVarValue9',
+                  'customVarValue10', 'customVarValue11', 'customVarValue12', 'customVarValue13', 'customVarValue14',
+                  'customVarValue15', 'customVarValue16', 'customVarValue17', 'customVarValue18', 'customVarValue19',
+                  'customVarValue20', 'dayOfWeekName', 'dateHour', 'dateHourMinute', 'yearMonth', 'yearWeek',
+                  'dcmClickAd', 'dcmClickAdId', 'dcmClickAdType', 'dcmClickAdTypeId', 'dcmClickAdvertiser',
+                  'dcmClickAdvertiserId', 'dcmClickCampaign', 'dcmClickCampaignId', 'dcmClickCreative',
+                  'dcmClickCreativeId', 'dcmClickRenderingId', 'dcmClickCreativeType', 'dcmClickCreativeTypeId',
+                  'dcmClickCreativeVersion', 'dcmClickSite', 'dcmClickSiteId', 'dcmClickSitePlacement',
+                  'dcmClickSitePlacementId', 'dcmClickSpotId', 'dcmFloodlightActivity',
+                  'dcmFloodlightActivityAndGroup', 'dcmFloodlightActivityGroup', 'dcmFloodlightActivityGroupId',
+                  'dcmFloodlightActivityId', 'dcmFloodlightAdvertiserId', 'dcmFloodlightSpotId', 'dcmLastEventAd',
+                  'dcmLastEventAdId', 'dcmLastEventAdType', 'dcmLastEventAdTypeId', 'dcmLastEventAdvertiser',
+                  'dcmLastEventAdvertiserId', 'dcmLastEventAttributionType', 'dcmLastEventCampaign',
+                  'dcmLastEventCampaignId', 'dcmLastEventCreative', 'dcmLastEventCreativeId',
+                  'dcmLastEventRenderingId', 'dcmLastEventCreativeType', 'dcmLastEventCreativeTypeId',
+                  'dcmLastEventCreativeVersion', 'dcmLastEventSite', 'dcmLastEventSiteId',
+                  'dcmLastEventSitePlacement', 'dcmLastEventSitePlacementId', 'dcmLastEventSpotId', 'userAgeBracket',
+                  'userGender', 'interestOtherCategory', 'interestAffinityCategory', 'interestInMarketCategory',
+                  'dfpLineItemId', 'dfpLineItemName', 'acquisitionCampaign', 'acquisitionMedium', 'acquisitionSource',
+                  'acquisitionSourceMedium', 'acquisitionTrafficChannel', 'cohort', 'channelGrouping',
+                  'dbmClickAdvertiser', 'dbmClickAdvertiserId', 'dbmClickCreativeId', 'dbmClickExchange',
+                  'dbmClickExchangeId', 'dbmClickInsertionOrder', 'dbmClickInsertionOrderId', 'dbmClickLineItem',
+                  'dbmClickLineItemId', 'dbmClickSite', 'dbmClickSiteId', 'dbmLastEventAdvertiser',
+                  'dbmLastEventAdvertiserId', 'dbmLastEventCreativeId', 'dbmLastEventExchange',
+                  'dbmLastEventExchangeId', 'dbmLastEventInsertionOrder', 'dbmLastEventInsertionOrderId',
+                  'dbmLastEventLineItem', 'dbmLastEventLineItemId', 'dbmLastEventSite', 'dbmLastEventSiteId',
+                  'dsAdGroup', 'dsAdGroupId', 'dsAdvertiser', 'dsAdvertiserId', 'dsAgency', 'dsAgencyId',
+                  'dsCampaign', 'dsCampaignId', 'dsEngineAccount', 'dsEngineAccountId', 'dsKeyword', 'dsKeywordId'
+                  ]
+
+DATE_COLUMNS = ['date']
+TIME_COLUMNS = ['time', 'avgSessionDuration', 'timeOnPage', 'avgTimeOnPage', 'searchDuration', 'timeOnScreen']
+
+# Target dtype for each known column, checked in the same order of precedence as the lists above were
+COLUMN_DTYPES = {
+    **{column: 'time' for column in TIME_COLUMNS},
+    **{column: 'string' for column in STRING_COLUMNS},
+    **{column: 'date' for column in DATE_COLUMNS},
+    **{column: 'float' for column in FLOAT_COLUMNS},
+    **{column: 'integer' for column in INTEGER_COLUMNS},
+}
+
+CAST_DTYPES = {'integer': int, 'float': float, 'string': str, 'time': float}
+
+# Column dtype for each columnHeaders dataType returned by the API
+API_DTYPES = {
+    'INTEGER': 'integer',
+    'FLOAT': 'float',
+    'CURRENCY': 'float',
+    'PERCENT': 'float',
+    'TIME': 'time',
+    'STRING': 'string',
+}
+
+# NumPy dtype each column dtype is parsed into
+PARSE_DTYPES = {'integer': np.int64, 'float': np.float64, 'time': np.float64, 'string': object}
+
+
 def set_dtypes(df):
     """Sets the correct data type for each column returned in the dataframe.
 
@@ -143,245 +800,963 @@ def set_dtypes(df):
     :return: Pandas dataframe with correct dtypes assigned to columns
     """
 
-    integer_dtype = ['sessionCount', 'daysSinceLastSession', 'userBucket', 'users', 'newUsers', '1dayUsers',
-                     '7dayUsers', '14dayUsers', '28dayUsers', '30dayUsers', 'sessionDurationBucket', 'sessions',
-                     'bounces', 'uniqueDimensionCombinations', 'hits', 'organicSearches', 'impressions', 'adclicks',
-                     'goal1Starts', 'goal2Starts', 'goal3Starts', 'goal4Starts', 'goal5Starts', 'goal6Starts',
-                     'goal7Starts', 'goal8Starts', 'goal9Starts', 'goal10Starts', 'goal11Starts', 'goal12Starts',
-                     'goal13Starts', 'goal14Starts', 'goal15Starts', 'goal16Starts', 'goal17Starts', 'goal18Starts',
-                     'goal19Starts', 'goal20Starts', 'goal1Completions', 'goal2Completions', 'goal3Completions',
-                     'goal4Completions', 'goal5Completions', 'goal6Completions', 'goal7Completions', 'goal8Completions',
-                     'goal9Completions', 'goal10Completions', 'goal11Completions', 'goal12Completions',
-                     'goal13Completions', 'goal14Completions', 'goal15Completions', 'goal16Completions',
-                     'goal17Completions', 'goal18Completions', 'goal19Completions', 'goal20Completions',
-                     'goalCompletionsAll', 'goalStartsAll', 'goal1Abandons', 'goal2Abandons', 'goal3Abandons',
-                     'goal4Abandons', 'goal5Abandons', 'goal6Abandons', 'goal7Abandons', 'goal8Abandons',
-                     'goal9Abandons', 'goal10Abandons', 'goal11Abandons', 'goal12Abandons', 'goal13Abandons',
-                     'goal14Abandons', 'goal15Abandons', 'goal16Abandons', 'goal17Abandons', 'goal18Abandons',
-                     'goal19Abandons', 'goal20Abandons', 'goalAbandonsAll', 'pageDepth', 'entrances', 'pageviews',
-                     'uniquePageviews', 'exits', 'searchResultViews', 'searchUniques', 'searchSessions', 'searchDepth',
-                     'searchRefinements', 'searchExits', 'pageLoadTime', 'pageLoadSample', 'domainLookupTime',
-                     'pageDownloadTime', 'redirectionTime', 'serverConnectionTime', 'serverResponseTime',
-                     'speedMetricsSample', 'domInteractiveTime', 'domContentLoadedTime', 'domLatencyMetricsSample',
-                     'screenviews', 'uniqueScreenviews', 'sessionsWithEvent', 'sessionsToTransaction',
-                     'daysToTransaction', 'transactions', 'itemQuantity', 'uniquePurchases', 'internalPromotionClicks',
-                     'internalPromotionViews', 'productAddsToCart', 'productCheckouts', 'productDetailViews',
-                     'productListClicks', 'productListViews', 'productRefunds', 'productRemovesFromCart',
-                     'quantityAddedToCart', 'quantityCheckedOut', 'quantityRefunded', 'quantityRemovedFromCart',
-                     'totalRefunds', 'socialInteractions', 'uniqueSocialInteractions', 'userTimingValue',
-                     'userTimingSample', 'exceptions', 'fatalExceptions', 'dimension1', 'dimension2', 'dimension3',
-                     'dimension4', 'dimension5', 'dimension6', 'dimension7', 'dimension8', 'dimension9', 'dimension10',
-                     'dimension11', 'dimension12', 'dimension13', 'dimension14', 'dimension15', 'dimension16',
-                     'dimension17', 'dimension18', 'dimension19', 'dimension20', 'customMetric1', 'customMetric2',
-                     'customMetric3', 'customMetric4', 'customMetric5', 'customMetric6', 'customMetric7',
-                     'customMetric8', 'customMetric9', 'customMetric10', 'customMetric11', 'customMetric12',
-                     'customMetric13', 'customMetric14', 'customMetric15', 'customMetric16', 'customMetric17',
-                     'customMetric18', 'customMetric19', 'customMetric20', 'year', 'month', 'week', 'day', 'hour',
-                     'minute', 'nthMonth', 'nthWeek', 'nthDay', 'nthMinute', 'dayOfWeek', 'isoWeek', 'isoYear',
-                     'isoYearIsoWeek', 'nthHour', 'dcmFloodlightQuantity', 'dcmClicks', 'dcmImpressions',
-                     'adsenseAdUnitsViewed', 'adsenseAdsViewed', 'adsenseAdsClicks', 'adsensePageImpressions',
-                     'adsenseExits', 'totalPublisherImpressions', 'totalPublisherMonetizedPageviews',
-                     'totalPublisherClicks', 'backfillImpressions', 'backfillMonetizedPageviews', 'backfillClicks',
-                     'dfpImpressions', 'dfpMonetizedPageviews', 'dfpClicks', 'cohortNthDay', 'cohortNthMonth',
-                     'cohortNthWeek', 'cohortActiveUsers', 'cohortTotalUsers', 'cohortTotalUsersWithLifetimeCriteria',
-                     'dbmClicks', 'dbmConversions', 'dbmImpressions', 'dsCost', 'dsImpressions'
-                     ]
-
-    float_dtype = ['percentNewSessions', 'sessionsPerUser', 'bounceRate', 'adCost', 'CPM', 'CPC', 'CTR',
-                   'costPerTransaction', 'costPerGoalConversion', 'RPC', 'ROAS', 'goal1Value', 'goal2Value',
-                   'goal3Value', 'goal4Value', 'goal5Value', 'goal6Value', 'goal7Value', 'goal8Value', 'goal9Value',
-                   'goal10Value', 'goal11Value', 'goal12Value', 'goal13Value', 'goal14Value', 'goal15Value',
-                   'goal16Value', 'goal17Value', 'goal18Value', 'goal19Value', 'goal20Value', 'goalValueAll',
-                   'goalValuePerSession', 'goal1ConversionRate', 'goal2ConversionRate', 'goal3ConversionRate',
-                   'goal4ConversionRate', 'goal5ConversionRate', 'goal6ConversionRate', 'goal7ConversionRate',
-                   'goal8ConversionRate', 'goal9ConversionRate', 'goal10ConversionRate', 'goal11ConversionRate',
-                   'goal12ConversionRate', 'goal13ConversionRate', 'goal14ConversionRate', 'goal15ConversionRate',
-                   'goal16ConversionRate', 'goal17ConversionRate', 'goal18ConversionRate', 'goal19ConversionRate',
-                   'goal20ConversionRate', 'goalConversionRateAll', 'goal1AbandonRate', 'goal2AbandonRate',
-                   'goal3AbandonRate', 'goal4AbandonRate', 'goal5AbandonRate', 'goal6AbandonRate', 'goal7AbandonRate',
-                   'goal8AbandonRate', 'goal9AbandonRate', 'goal10AbandonRate', 'goal11AbandonRate',
-                   'goal12AbandonRate', 'goal13AbandonRate', 'goal14AbandonRate', 'goal15AbandonRate',
-                   'goal16AbandonRate', 'goal17AbandonRate', 'goal18AbandonRate', 'goal19AbandonRate',
-                   'goal20AbandonRate', 'goalAbandonRateAll', 'latitude', 'longitude', 'pageValue', 'entranceRate',
-                   'pageviewsPerSession', 'exitRate', 'avgSearchResultViews', 'percentSessionsWithSearch',
-                   'avgSearchDepth', 'percentSearchRefinements', 'searchExitRate', 'searchGoalConversionRateAll',
-                   'goalValueAllPerSearch', 'searchGoal1ConversionRate', 'searchGoal2ConversionRate',
-                   'searchGoal3ConversionRate', 'searchGoal4ConversionRate', 'searchGoal5ConversionRate',
-                   'searchGoal6ConversionRate', 'searchGoal7ConversionRate', 'searchGoal8ConversionRate',
-                   'searchGoal9ConversionRate', 'searchGoal10ConversionRate', 'searchGoal11ConversionRate',
-                   'searchGoal12ConversionRate', 'searchGoal13ConversionRate', 'searchGoal14ConversionRate',
-                   'searchGoal15ConversionRate', 'searchGoal16ConversionRate', 'searchGoal17ConversionRate',
-                   'searchGoal18ConversionRate', 'searchGoal19ConversionRate', 'searchGoal20ConversionRate',
-                   'avgPageLoadTime', 'avgDomainLookupTime', 'avgPageDownloadTime', 'avgRedirectionTime',
-                   'avgServerConnectionTime', 'avgServerResponseTime', 'avgDomInteractiveTime',
-                   'avgDomContentLoadedTime', 'avgDomLatencyMetricsSample', 'screenviewsPerSession',
-                   'avgScreenviewDuration', 'eventValue', 'eventsPerSessionWithEvent', 'transactionsPerSession',
-                   'transactionRevenue', 'revenuePerTransaction', 'transactionRevenuePerSession', 'transactionShipping',
-                   'transactionTax', 'totalValue', 'revenuePerItem', 'itemRevenue', 'itemsPerPurchase',
-                   'localTransactionRevenue', 'localTransactionShipping', 'localTransactionTax', 'localItemRevenue',
-                   'buyToDetailRate', 'cartToDetailRate', 'internalPromotionCTR', 'localProductRefundAmount',
-                   'localRefundAmount', 'productListCTR', 'productRefundAmount', 'productRevenuePerPurchase',
-                   'refundAmount', 'revenuePerUser', 'transactionsPerUser', 'socialInteractionsPerSession',
-                   'avgUserTimingValue', 'exceptionsPerScreenview', 'fatalExceptionsPerScreenview',
-                   'dcmFloodlightRevenue', 'dcmCPC', 'dcmCTR', 'dcmCost', 'dcmROAS', 'dcmRPC', 'adsenseRevenue',
-                   'adsenseCTR', 'adsenseECPM', 'adsenseViewableImpressionPercent', 'adsenseCoverage',
-                   'totalPublisherCoverage', 'totalPublisherImpressionsPerSession', 'totalPublisherECPM',
-                   'totalPublisherViewableImpressionsPercent', 'totalPublisherCTR', 'totalPublisherRevenue',
-                   'totalPublisherRevenuePer1000Sessions', 'adxImpressions', 'adxMonetizedPageviews', 'adxClicks',
-                   'adxCoverage', 'adxImpressionsPerSession', 'adxViewableImpressionsPercent', 'adxCTR', 'adxRevenue',
-                   'adxRevenuePer1000Sessions', 'adxECPM', 'backfillCoverage', 'backfillImpressionsPerSession',
-                   'backfillViewableImpressionsPercent', 'backfillCTR', 'backfillRevenue', 'backfillECPM',
-                   'backfillRevenuePer1000Sessions', 'dfpCoverage', 'dfpImpressionsPerSession',
-                   'dfpViewableImpressionsPercent', 'dfpCTR', 'dfpRevenue', 'dfpRevenuePer1000Sessions', 'dfpECPM',
-                   'cohortAppviewsPerUser', 'cohortAppviewsPerUserWithLifetimeCriteria', 'cohortGoalCompletionsPerUser',
-                   'cohortGoalCompletionsPerUserWithLifetimeCriteria', 'cohortPageviewsPerUser',
-                   'cohortPageviewsPerUserWithLifetimeCriteria', 'cohortRetentionRate', 'cohortRevenuePerUser',
-                   'cohortRevenuePerUserWithLifetimeCriteria', 'cohortSessionDurationPerUser',
-                   'cohortSessionDurationPerUserWithLifetimeCriteria', 'cohortSessionsPerUser',
-                   'cohortSessionsPerUserWithLifetimeCriteria', 'dbmCPA', 'dbmCPC', 'dbmCPM', 'dbmCTR', 'dbmCost',
-                   'dbmROAS', 'dsCPC', 'dsCTR', 'dsProfit', 'dsReturnOnAdSpend', 'dsRevenuePerClick'
-                   ]
+    dtypes = {column: COLUMN_DTYPES[column] for column in df.columns if column in COLUMN_DTYPES}
 
-    string_dtype = ['userType', 'userDefinedValue', 'referralPath', 'fullReferrer', 'campaign', 'source', 'medium',
-                    'sourceMedium', 'keyword', 'adContent', 'socialNetwork', 'hasSocialSourceReferral',
-                    'campaignCode', 'adGroup', 'adSlot', 'adDistributionNetwork', 'adMatchType',
-                    'adKeywordMatchType', 'adMatchedQuery', 'adPlacementDomain', 'adPlacementUrl', 'adFormat',
-                    'adTargetingType', 'adTargetingOption', 'adDisplayUrl', 'adDestinationUrl',
-                    'adwordsCustomerID', 'adwordsCampaignID', 'adwordsAdGroupID', 'adwordsCreativeID',
-                    'adwordsCriteriaID', 'adQueryWordCount', 'isTrueViewVideoAd', 'goalCompletionLocation',
-                    'goalPreviousStep1', 'goalPreviousStep2', 'goalPreviousStep3', 'browser', 'browserVersion',
-                    'operatingSystem', 'operatingSystemVersion', 'mobileDeviceBranding', 'mobileDeviceModel',
-                    'mobileDeviceInputSelector', 'mobileDeviceInfo', 'mobileDeviceMarketingName', 'deviceCategory',
-                    'browserSize', 'dataSource', 'continent', 'subContinent', 'country', 'region', 'metro', 'city',
-                    'networkDomain', 'cityId', 'continentId', 'countryIsoCode', 'metroId', 'regionId', 'regionIsoCode',
-                    'subContinentCode', 'flashVersion', 'javaEnabled', 'language', 'screenColors',
-                    'sourcePropertyDisplayName', 'sourcePropertyTrackingId', 'screenResolution', 'hostname', 'pagePath',
-                    'pagePathLevel1', 'pagePathLevel2', 'pagePathLevel3', 'pagePathLevel4', 'pageTitle',
-                    'landingPagePath', 'secondPagePath', 'exitPagePath', 'previousPagePath', 'searchUsed',
-                    'searchKeyword', 'searchKeywordRefinement', 'searchCategory', 'searchStartPage',
-                    'searchDestinationPage', 'searchAfterDestinationPage', 'appInstallerId', 'appVersion', 'appName',
-                    'appId', 'screenName', 'screenDepth', 'landingScreenName', 'exitScreenName', 'eventCategory',
-                    'eventAction', 'eventLabel', 'transactionId', 'affiliation', 'productSku', 'productName',
-                    'productCategory', 'currencyCode', 'checkoutOptions', 'internalPromotionCreative',
-                    'internalPromotionId', 'internalPromotionName', 'internalPromotionPosition', 'orderCouponCode',
-                    'productBrand', 'productCategoryHeirarchy', 'productCouponCode', 'productListName',
-                    'productListPosition', 'productVariant', 'shoppingStage', 'socialInteractionNetwork',
-                    'socialInteractionAction', 'socialInteractionNetworkAction', 'socialInteractionTarget',
-                    'socialEngagementType', 'userTimingCategory', 'userTimingLabel', 'userTimingVariable',
-                    'exceptionDescription', 'experimentId', 'experimentVariant', 'experimentCombination',
-                    'experimentName', 'customVarName1', 'customVarName2', 'customVarName3', 'customVarName4',
-                    'customVarName5', 'customVarName6', 'customVarName7', 'customVarName8', 'customVarName9',
-                    'customVarName10', 'customVarName11', 'customVarName12', 'customVarName13', 'customVarName14',
-                    'customVarName15', 'customVarName16', 'customVarName17', 'customVarName18', 'customVarName19',
-                    'customVarName20', 'customVarValue1', 'customVarValue2', 'customVarValue3', 'customVarValue4',
-                    'customVarValue5', 'customVarValue6', 'customVarValue7', 'customVarValue8', 'customVarValue9',
-                    'customVarValue10', 'customVarValue11', 'customVarValue12', 'customVarValue13', 'customVarValue14',
-                    'customVarValue15', 'customVarValue16', 'customVarValue17', 'customVarValue18', 'customVarValue19',
-                    'customVarValue20', 'dayOfWeekName', 'dateHour', 'dateHourMinute', 'yearMonth', 'yearWeek',
-                    'dcmClickAd', 'dcmClickAdId', 'dcmClickAdType', 'dcmClickAdTypeId', 'ga:dcmClickAdvertiser',
-                    'dcmClickAdvertiserId', 'dcmClickCampaign', 'dcmClickCampaignId', 'dcmClickCreative',
-                    'dcmClickCreativeId', 'dcmClickRenderingId', 'dcmClickCreativeType', 'dcmClickCreativeTypeId',
-                    'dcmClickCreativeVersion', 'dcmClickSite', 'dcmClickSiteId', 'dcmClickSitePlacement',
-                    'dcmClickSitePlacementId', 'dcmClickSpotId', 'dcmFloodlightActivity',
-                    'dcmFloodlightActivityAndGroup', 'dcmFloodlightActivityGroup', 'dcmFloodlightActivityGroupId',
-                    'dcmFloodlightActivityId', 'dcmFloodlightAdvertiserId', 'dcmFloodlightSpotId', 'dcmLastEventAd',
-                    'dcmLastEventAdId', 'dcmLastEventAdType', 'dcmLastEventAdTypeId', 'dcmLastEventAdvertiser',
-                    'dcmLastEventAdvertiserId', 'dcmLastEventAttributionType', 'dcmLastEventCampaign',
-                    'dcmLastEventCampaignId', 'dcmLastEventCreative', 'dcmLastEventCreativeId',
-                    'dcmLastEventRenderingId', 'dcmLastEventCreativeType', 'dcmLastEventCreativeTypeId',
-                    'dcmLastEventCreativeVersion', 'dcmLastEventSite', 'dcmLastEventSiteId',
-                    'dcmLastEventSitePlacement', 'dcmLastEventSitePlacementId', 'dcmLastEventSpotId', 'userAgeBracket',
-                    'userGender', 'interestOtherCategory', 'interestAffinityCategory', 'interestInMarketCategory',
-                    'dfpLineItemId', 'dfpLineItemName', 'acquisitionCampaign', 'acquisitionMedium', 'acquisitionSource',
-                    'acquisitionSourceMedium', 'acquisitionTrafficChannel', 'cohort', 'channelGrouping',
-                    'dbmClickAdvertiser', 'dbmClickAdvertiserId', 'dbmClickCreativeId', 'dbmClickExchange',
-                    'dbmClickExchangeId', 'dbmClickInsertionOrder', 'dbmClickInsertionOrderId', 'dbmClickLineItem',
-                    'dbmClickLineItemId', 'dbmClickSite', 'dbmClickSiteId', 'dbmLastEventAdvertiser',
-                    'dbmLastEventAdvertiserId', 'dbmLastEventCreativeId', 'dbmLastEventExchange',
-                    'dbmLastEventExchangeId', 'dbmLastEventInsertionOrder', 'dbmLastEventInsertionOrderId',
-                    'dbmLastEventLineItem', 'dbmLastEventLineItemId', 'dbmLastEventSite', 'dbmLastEventSiteId',
-                    'dsAdGroup', 'dsAdGroupId', 'dsAdvertiser', 'dsAdvertiserId', 'dsAgency', 'dsAgencyId',
-                    'dsCampaign', 'dsCampaignId', 'dsEngineAccount', 'dsEngineAccountId', 'dsKeyword', 'dsKeywordId'
-                    ]
-
-    date_dtype = ['date']
-    time_dtype = ['time', 'avgSessionDuration', 'timeOnPage', 'avgTimeOnPage', 'searchDuration', 'timeOnScreen']
-
-    for column in df.columns:
-        if column in integer_dtype:
-            df[column] = df[column].astype(int)
-        elif column in float_dtype:
-            df[column] = df[column].astype(float)
-        elif column in date_dtype:
-            df[column] = pd.to_datetime(df[column])
-        elif column in string_dtype:
-            df[column] = df[column].astype(str)
-        elif column in time_dtype:
-            df[column] = df[column].astype(str)
-        else:
-            df[column] = df[column]
+    # Cast every integer, float and string column not already of the right dtype in a single pass
+    casts = {column: CAST_DTYPES[dtype] for column, dtype in dtypes.items()
+             if dtype in CAST_DTYPES and df[column].dtype != CAST_DTYPES[dtype]}
+    if casts:
+        df = df.astype(casts)
+
+    for column, dtype in dtypes.items():
+        if dtype == 'date':
+            df[column] = pd.to_datetime(df[column], format='%Y%m%d')
     return df
 
 
-def results_to_pandas(results):
+def get_column_dtype(header):
+    """Return the column dtype (integer, float, time, date or string) for a columnHeaders entry.
+
+    Metrics use the dataType reported by the API. Columns reported as STRING, which includes every dimension, are
+    looked up in COLUMN_DTYPES, which acts as an override table so that numeric and date dimensions such as ga:year
+    or ga:date are still converted.
+
+    :param header: columnHeaders entry from a Google Analytics API results set
+    :return: Column dtype name
+    """
+
+    name = header['name'].replace('ga:', '')
+    dtype = API_DTYPES.get(header.get('dataType'))
+
+    # Metrics always hold numbers, even if the API reports an unexpected dataType
+    if dtype is None and header.get('columnType') == 'METRIC':
+        return COLUMN_DTYPES.get(name, 'float')
+
+    if dtype is None or dtype == 'string':
+        return COLUMN_DTYPES.get(name, 'string')
+
+    return dtype
+
+
+def parse_column(values, dtype):
+    """Parse a column of string values returned by the API directly into its final dtype.
+
+    :param values: NumPy object array of string values for one column
+    :param dtype: Column dtype returned by get_column_dtype()
+    :return: NumPy array or Pandas array
+    """
+
+    if dtype == 'date':
+        return pd.to_datetime(values, format='%Y%m%d')
+
+    return values.astype(PARSE_DTYPES.get(dtype, object))
+
+
+def to_categorical(values, column, categories=None):
+    """Return a column of dimension values as a Pandas Categorical.
+
+    If a categories dictionary is passed, the categories seen for the column are stored in it and extended with any new
+    values, so that pages converted one after another share the same category codes. Later pages may have extra
+    categories appended, so combine pages with pandas.api.types.union_categoricals() rather than relying on concat.
+
+    :param values: NumPy object array of string values for one column
+    :param column: Name of the column
+    :param categories: Optional dictionary of column name to Pandas Index of known categories, updated in place
+    :return: Pandas Categorical
+    """
+
+    if categories is None:
+        return pd.Categorical(values)
+
+    known = categories.get(column, pd.Index([], dtype=object))
+    unique_values = pd.Index(pd.unique(values))
+    new_values = unique_values[~unique_values.isin(known)]
+
+    if len(new_values):
+        known = known.append(new_values)
+    categories[column] = known
+
+    return pd.Categorical(values, categories=known)
+
+
+def results_to_pandas(results, categorical=False, categories=None):
     """Return a Google Analytics result set in a Pandas DataFrame.
 
+    The rows are loaded into a single two-dimensional array and each column is parsed straight into the dtype given
+    by its columnHeaders metadata (see get_column_dtype()), so metrics missing from the static column lists are
+    still returned as numbers.
+
     :param results: Google Analytics API results set
+    :param categorical: Set to True to return string dimension columns as Pandas Categoricals
+    :param categories: Optional dictionary of known categories per column, shared across pages (see to_categorical())
     :return: Pandas DataFrame containing results
     """
 
     if results['columnHeaders']:
         column_headers = results['columnHeaders']
-        headings = []
-        for header in column_headers:
-            name = header['name'].replace('ga:', '')
-            headings.append(name)
 
-        if results['rows']:
-            rows = results['rows']
+        if results.get('rows'):
+            values = np.array(results['rows'], dtype=object)
+            columns = {}
+            strings = []
 
-            df = pd.DataFrame(rows, columns=headings)
-            return set_dtypes(df)
+            for i, header in enumerate(column_headers):
+                heading = header['name'].replace('ga:', '')
+                dtype = get_column_dtype(header)
 
+                if dtype == 'string' and categorical and header.get('columnType', 'DIMENSION') == 'DIMENSION':
+                    columns[heading] = to_categorical(values[:, i], heading, categories)
+                else:
+                    columns[heading] = parse_column(values[:, i], dtype)
+                    if dtype == 'string':
+                        strings.append(heading)
 
-def get_results(service, final_payload):
-    """Passes a payload to the API using the service object and returns all available results by merging paginated
-    data together into a single DataSet.
+            df = pd.DataFrame(columns)
+            return df.astype({heading: str for heading in strings})
+
+
+def results_to_arrow(results):
+    """Return a Google Analytics result set as a PyArrow Table. Requires the optional pyarrow package.
+
+    Columns are typed from the columnHeaders metadata in the same way as results_to_pandas(), with string dimensions
+    dictionary encoded, without building an intermediate DataFrame.
+
+    :param results: Google Analytics API results set
+    :return: PyArrow Table containing results
+    """
+
+    import pyarrow as pa
+
+    if results['columnHeaders']:
+        column_headers = results['columnHeaders']
+
+        if results.get('rows'):
+            values = np.array(results['rows'], dtype=object)
+            arrays = []
+
+            for i, header in enumerate(column_headers):
+                dtype = get_column_dtype(header)
+                if dtype == 'string':
+                    arrays.append(pa.array(values[:, i], type=pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(parse_column(values[:, i], dtype)))
+
+            return pa.table(arrays, names=[header['name'].replace('ga:', '') for header in column_headers])
+
+
+def pages_to_arrow(pages):
+    """Convert an iterable of page results sets into a single PyArrow Table, one record batch per page, so the raw
+    rows of only one page are held in memory at a time.
+
+    :param pages: Iterable of Google Analytics API results sets, such as the output of iter_pages()
+    :return: PyArrow Table containing results from all pages
+    """
+
+    import pyarrow as pa
+
+    tables = [table for table in map(results_to_arrow, pages) if table is not None]
+    if tables:
+        return pa.concat_tables(tables)
+
+
+def arrow_to_pandas(table):
+    """Convert a PyArrow Table returned by run_query(output='arrow') into a Pandas DataFrame with as little copying
+    as possible. Dictionary encoded dimensions become Pandas Categoricals.
+
+    The table's memory is released during conversion, so it must not be used afterwards.
+
+    :param table: PyArrow Table
+    :return: Pandas DataFrame
+    """
+
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def resolve_date(value, today=None):
+    """Resolve a relative API date (today, yesterday or NdaysAgo) to a YYYY-MM-DD date.
+
+    :param value: Date string from an API payload
+    :param today: Optional date to resolve relative dates against (default is the current local date)
+    :return: Date string in YYYY-MM-DD format
+    """
+
+    today = today or date.today()
+    match = re.fullmatch(r'(\d+)daysAgo', value)
+
+    if value == 'today':
+        return today.isoformat()
+    elif value == 'yesterday':
+        return (today - timedelta(days=1)).isoformat()
+    elif match:
+        return (today - timedelta(days=int(match.group(1)))).isoformat()
+    else:
+        return value
+
+
+def split_fields(value):
+    """Split a comma separated list of metrics or dimensions, stripping any whitespace.
+
+    :param value: Comma separated string, such as 'ga:sessions, ga:pageviews'
+    :return: List of field names
+    """
+
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+
+def canonicalize_payload(final_payload, today=None):
+    """Return a normalised copy of a payload, so that equivalent queries compare equal. Keys use underscores,
+    whitespace is stripped, metrics and dimensions are sorted and relative dates are resolved.
+
+    :param final_payload: Final payload to pass to API
+    :param today: Optional date to resolve relative dates against
+    :return: Normalised payload dictionary
+    """
+
+    canonical = {}
+
+    for key, value in final_payload.items():
+        key = key.replace('-', '_')
+
+        if isinstance(value, str):
+            value = value.strip()
+
+            if key in ('metrics', 'dimensions'):
+                value = ','.join(sorted(split_fields(value)))
+            elif key in ('start_date', 'end_date'):
+                value = resolve_date(value, today)
+
+        canonical[key] = value
+
+    return canonical
+
+
+def get_payload_key(final_payload, today=None):
+    """Return a stable hash of the canonical form of a payload, for use as a cache key.
+
+    :param final_payload: Final payload to pass to API
+    :param today: Optional date to resolve relative dates against
+    :return: Hex digest string
+    """
+
+    canonical = json.dumps(canonicalize_payload(final_payload, today), sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def order_columns(results, final_payload):
+    """Reorder the columns of a results set to match the dimension and metric order requested in a payload. Cached
+    results may have been fetched by a query listing the same fields in a different order.
+
+    :param results: Google Analytics API results set
+    :param final_payload: Final payload the results are being returned for
+    :return: Results set with columnHeaders and rows in the requested order
+    """
+
+    names = [header['name'] for header in results.get('columnHeaders', [])]
+    requested = split_fields(final_payload.get('dimensions', '')) + split_fields(final_payload.get('metrics', ''))
+
+    if names == requested or sorted(names) != sorted(requested):
+        return results
+
+    order = [names.index(name) for name in requested]
+    results['columnHeaders'] = [results['columnHeaders'][i] for i in order]
+    if results.get('rows'):
+        results['rows'] = [[row[i] for i in order] for row in results['rows']]
+
+    return results
+
+
+def get_cached_results(service, final_payload, cache, workers=1, checkpoint_dir=None):
+    """Return the results for a payload from a cache, calling get_results() and storing the results on a miss.
 
     :param service: Google Analytics service object
     :param final_payload: Final payload to pass to API
-    :return: Original result object with rows data manipulated to contains rows from all pages
+    :param cache: Object with get(key) and set(key, results) methods, such as gapandas.cache.SQLiteCache
+    :param workers: Number of pages to fetch concurrently on a cache miss
+    :param checkpoint_dir: Optional spool directory in which to checkpoint pages on a cache miss
+    :return: Google Analytics API results set
+    """
+
+    key = get_payload_key(final_payload)
+    results = cache.get(key)
+
+    if results is None:
+        results = get_results(service, final_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+        cache.set(key, results)
+        return results
+
+    results = order_columns(results, final_payload)
+    results['apiCalls'] = 0
+    return results
+
+
+# Dimensions that keep rows from different date partitions apart, so partitioned results can be concatenated
+PARTITION_DIMENSIONS = {
+    'day': ['ga:date', 'ga:dateHour', 'ga:dateHourMinute'],
+    'week': ['ga:date', 'ga:dateHour', 'ga:dateHourMinute', 'ga:isoYearIsoWeek'],
+    'month': ['ga:date', 'ga:dateHour', 'ga:dateHourMinute', 'ga:yearMonth'],
+}
+
+# Count and sum metrics whose totals can be added up across date partitions. Every other metric is left out of merged
+# totals, including ratios, averages such as pageValue, and user counts such as users or 7dayUsers, for which a user
+# active in several partitions would be counted more than once.
+ADDITIVE_METRICS = {
+    'newUsers', 'sessions', 'bounces', 'sessionDuration', 'hits', 'organicSearches', 'impressions', 'adClicks',
+    'adCost', 'goalStartsAll', 'goalCompletionsAll', 'goalValueAll', 'goalAbandonsAll', 'entrances', 'pageviews',
+    'uniquePageviews', 'timeOnPage', 'exits', 'searchResultViews', 'searchUniques', 'searchSessions', 'searchDepth',
+    'searchRefinements', 'searchDuration', 'searchExits', 'pageLoadTime', 'pageLoadSample', 'domainLookupTime',
+    'pageDownloadTime', 'redirectionTime', 'serverConnectionTime', 'serverResponseTime', 'speedMetricsSample',
+    'domInteractiveTime', 'domContentLoadedTime', 'domLatencyMetricsSample', 'screenviews', 'uniqueScreenviews',
+    'timeOnScreen', 'totalEvents', 'uniqueEvents', 'eventValue', 'sessionsWithEvent', 'transactions',
+    'transactionRevenue', 'transactionShipping', 'transactionTax', 'totalValue', 'itemQuantity', 'uniquePurchases',
+    'itemRevenue', 'localTransactionRevenue', 'localTransactionShipping', 'localTransactionTax', 'localItemRevenue',
+    'socialInteractions', 'uniqueSocialInteractions', 'userTimingValue', 'userTimingSample', 'exceptions',
+    'fatalExceptions', 'productAddsToCart', 'productCheckouts', 'productDetailViews', 'productListClicks',
+    'productListViews', 'productRefundAmount', 'productRefunds', 'productRemovesFromCart', 'quantityAddedToCart',
+    'quantityCheckedOut', 'quantityRefunded', 'quantityRemovedFromCart',
+    'refundAmount', 'localRefundAmount', 'totalRefunds', 'internalPromotionClicks', 'internalPromotionViews',
+    'dcmClicks', 'dcmCost', 'dcmImpressions', 'adsenseRevenue', 'adsenseAdUnitsViewed', 'adsenseAdsViewed',
+    'adsenseAdsClicks', 'adsensePageImpressions', 'adsenseExits', 'totalPublisherImpressions',
+    'totalPublisherMonetizedPageviews', 'totalPublisherClicks', 'totalPublisherRevenue',
+}
+
+# Numbered goal and custom metrics, which are also counts and sums
+ADDITIVE_METRIC_PATTERN = re.compile(r'goal\d+(Starts|Completions|Value|Abandons)|metric\d+')
+
+
+def split_date_range(start_date, end_date, partition='month'):
+    """Split a date range into consecutive partitions of one day, one ISO week (Monday to Sunday) or one calendar month.
+
+    :param start_date: Start date in YYYY-MM-DD format
+    :param end_date: End date in YYYY-MM-DD format
+    :param partition: Partition size (day, week or month)
+    :return: List of (start_date, end_date) tuples in YYYY-MM-DD format
+    """
+
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    ranges = []
+
+    while start <= end:
+        if partition == 'day':
+            part_end = start
+        elif partition == 'week':
+            part_end = min(end, start + timedelta(days=6 - start.weekday()))
+        elif partition == 'month':
+            next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+            part_end = min(end, next_month - timedelta(days=1))
+        else:
+            raise ValueError('Unsupported partition: ' + str(partition))
+
+        ranges.append((start.isoformat(), part_end.isoformat()))
+        start = part_end + timedelta(days=1)
+
+    return ranges
+
+
+def is_additive(header):
+    """Return True if the totals of a metric column can be summed across separate queries.
+
+    :param header: columnHeaders entry from a Google Analytics API results set
+    :return: True if the metric is additive
+    """
+
+    if header.get('columnType') != 'METRIC':
+        return False
+
+    name = header['name'].replace('ga:', '')
+    return name in ADDITIVE_METRICS or ADDITIVE_METRIC_PATTERN.fullmatch(name) is not None
+
+
+def merge_results(results_list):
+    """Merge result sets for consecutive date partitions of the same query into a single result set.
+
+    Rows are concatenated in partition order. totalsForAllResults is recomputed for additive metrics (see
+    ADDITIVE_METRICS). Totals of other metrics, such as ratios, averages and user counts, cannot be recomputed from
+    partition totals and are left out.
+
+    :param results_list: List of Google Analytics API results sets
+    :return: Merged Google Analytics API results set
+    """
+
+    results = dict(results_list[0])
+    rows = []
+    totals = {}
+
+    for part in results_list:
+        rows.extend(part.get('rows', []))
+
+    for header in results.get('columnHeaders', []):
+        if is_additive(header):
+            name = header['name']
+            total = sum(float(part.get('totalsForAllResults', {}).get(name, 0)) for part in results_list)
+            totals[name] = str(int(total)) if header['dataType'] == 'INTEGER' else str(total)
+
+    results['rows'] = rows
+    results['totalResults'] = len(rows)
+    results['totalsForAllResults'] = totals
+    results['containsSampledData'] = any(part.get('containsSampledData', False) for part in results_list)
+    results['apiCalls'] = sum(part.get('apiCalls', 0) for part in results_list)
+
+    return results
+
+
+def get_partitioned_results(service, final_payload, partition='month', cache=None, freshness_days=3, workers=1,
+                            partition_workers=1, checkpoint_dir=None):
+    """Return the results for a payload by querying each day, week or month of its date range separately.
+
+    Shorter date ranges are less likely to be sampled, and the partitions can be fetched concurrently. Partitions that
+    end more than freshness_days ago hold data that no longer changes, so when a cache is passed they are stored in it
+    permanently and only the recent, still mutable partitions are fetched from the API again.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API. Its dimensions must include a date dimension at least as
+        fine as the partition, such as ga:date, so the rows of different partitions do not overlap.
+    :param partition: Partition size (day, week or month)
+    :param cache: Optional object with get(key) and set(key, results, ttl) methods, such as gapandas.cache.SQLiteCache
+    :param freshness_days: Number of days after which data is treated as final
+    :param workers: Number of pages to fetch concurrently for each partition
+    :param partition_workers: Number of partitions to fetch concurrently (default 1)
+    :param checkpoint_dir: Optional spool directory in which to checkpoint pages
+    :return: Merged Google Analytics API results set
+    """
+
+    dimensions = split_fields(final_payload.get('dimensions', ''))
+    if not set(dimensions) & set(PARTITION_DIMENSIONS.get(partition, [])):
+        raise ValueError('Partitioning by ' + str(partition) + ' requires one of these dimensions: ' +
+                         ', '.join(PARTITION_DIMENSIONS.get(partition, [])))
+
+    today = date.today()
+    horizon = (today - timedelta(days=freshness_days)).isoformat()
+    start_date = resolve_date(final_payload['start_date'], today)
+    end_date = resolve_date(final_payload['end_date'], today)
+    service = get_shared_service(service, partition_workers * workers)
+
+    def get_partition(date_range):
+        part_start, part_end = date_range
+        part_payload = {**final_payload, 'start_date': part_start, 'end_date': part_end}
+
+        if cache is None or part_end >= horizon:
+            return get_results(service, part_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+
+        key = get_payload_key(part_payload)
+        results = cache.get(key)
+
+        if results is None:
+            results = get_results(service, part_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+            cache.set(key, results, ttl=None)
+        else:
+            results = order_columns(results, part_payload)
+            results['apiCalls'] = 0
+
+        return results
+
+    date_ranges = split_date_range(start_date, end_date, partition)
+
+    if partition_workers > 1:
+        with ThreadPoolExecutor(max_workers=partition_workers) as executor:
+            results_list = map_in_context(executor, get_partition, date_ranges)
+    else:
+        results_list = [get_partition(date_range) for date_range in date_ranges]
+
+    return merge_results(results_list)
+
+
+def get_sampling_ratio(results):
+    """Return the proportion of sessions used to calculate a result set, which is 1.0 for unsampled data.
+
+    :param results: Google Analytics API results set
+    :return: Ratio of sampleSize to sampleSpace
+    """
+
+    if results.get('containsSampledData') and results.get('sampleSpace'):
+        return int(results['sampleSize']) / int(results['sampleSpace'])
+    return 1.0
+
+
+def get_adaptive_results(service, final_payload, max_depth=5, workers=1, partition_workers=4, checkpoint_dir=None):
+    """Return the results for a payload, splitting its date range in half until no part is sampled.
+
+    The first page of each part is checked for containsSampledData before any more pages are fetched. Sampled parts
+    are bisected and queried again, up to max_depth times or until they cover a single day. All parts at the same depth
+    are fetched concurrently. The sampling ratio of every part is reported in the shards key of the result.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API. Its dimensions must include ga:date, ga:dateHour or
+        ga:dateHourMinute, so the rows of different parts do not overlap.
+    :param max_depth: Maximum number of times a date range is bisected
+    :param workers: Number of pages to fetch concurrently for each part
+    :param partition_workers: Number of parts to fetch concurrently
+    :param checkpoint_dir: Optional spool directory in which to checkpoint pages
+    :return: Merged Google Analytics API results set
+    """
+
+    dimensions = split_fields(final_payload.get('dimensions', ''))
+    if not set(dimensions) & set(PARTITION_DIMENSIONS['day']):
+        raise ValueError('Adaptive splitting requires one of these dimensions: ' +
+                         ', '.join(PARTITION_DIMENSIONS['day']))
+
+    service = get_shared_service(service, partition_workers * workers)
+
+    def get_part(part):
+        part_start, part_end, depth = part
+        part_payload = {**final_payload, 'start_date': part_start, 'end_date': part_end}
+        pages = iter_pages(service, part_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+        results = next(pages)
+
+        if results.get('containsSampledData') and depth < max_depth and part_start < part_end:
+            pages.close()
+            if checkpoint_dir is not None:
+                clear_checkpoints(checkpoint_dir, part_payload)
+            return None, get_api_calls(results)
+
+        return collect_pages(results, pages), 0
+
+    start_date = resolve_date(final_payload['start_date'])
+    end_date = resolve_date(final_payload['end_date'])
+    pending = [(start_date, end_date, 0)]
+    completed = []
+    probes = 0
+
+    with ThreadPoolExecutor(max_workers=partition_workers) as executor:
+        while pending:
+            split = []
+
+            for part, (results, probe_calls) in zip(pending, map_in_context(executor, get_part, pending)):
+                part_start, part_end, depth = part
+
+                if results is None:
+                    probes += probe_calls
+                    start = date.fromisoformat(part_start)
+                    middle = start + (date.fromisoformat(part_end) - start) // 2
+                    split.append((part_start, middle.isoformat(), depth + 1))
+                    split.append(((middle + timedelta(days=1)).isoformat(), part_end, depth + 1))
+                else:
+                    completed.append((part, results))
+
+            pending = split
+
+    completed.sort(key=lambda item: item[0][0])
+    results = merge_results([results for part, results in completed])
+    results['apiCalls'] += probes
+    results['shards'] = [{'start_date': part_start,
+                          'end_date': part_end,
+                          'depth': depth,
+                          'containsSampledData': part_results.get('containsSampledData', False),
+                          'samplingRatio': get_sampling_ratio(part_results)}
+                         for (part_start, part_end, depth), part_results in completed]
+
+    return results
+
+
+def get_start_indexes(results):
+    """Return the start_index of every page after the first in a Google Analytics API result set.
+
+    :param results: Google Analytics API results set for the first page
+    :return: List of 1-based start_index values for the remaining pages
     """
 
-    # Run the query and determine the number of items and pages
-    results = service.data().ga().get(**final_payload).execute()
     total_results = get_total_results(results)
-    total_pages = get_total_pages(results)
     items_per_page = get_items_per_page(results)
 
-    # Return multiple pages of results
-    if total_pages and total_pages > 1:
+    if total_results and items_per_page:
+        return list(range(1 + items_per_page, total_results + 1, items_per_page))
+    return []
 
-        start_index = 0
-        all_rows = []
 
-        while start_index <= total_results:
-            # Determine start_index and add to payload
-            start_index_payload = {'start_index': + start_index + 1}
-            final_payload = {**final_payload, **start_index_payload}
+def get_api_calls(results):
+    """Return the number of API requests, including retries, made to build a result set returned by get_results.
 
-            # Fetch results and append rows
-            next_results = service.data().ga().get(**final_payload).execute()
-            next_rows = get_rows(next_results)
-            all_rows = all_rows + next_rows
+    :param results: Google Analytics API results set
+    :return: Number of API requests
+    """
 
-            # Update start_index
-            start_index = (items_per_page + start_index)
+    return results.get('apiCalls', 1)
 
-        # Replace rows in initial results with all rows
-        results['rows'] = all_rows
+
+# Retry settings for transient API errors
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 32
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RETRYABLE_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded', 'quotaExceeded', 'backendError',
+                     'internalServerError')
+
+
+def map_in_context(executor, function, items):
+    """Call a function on each item using an executor, like executor.map(), but run each call in a copy of the
+    caller's context so that settings such as the rate limit priority carry over to the worker threads.
+
+    :param executor: concurrent.futures executor
+    :param function: Function to call with each item
+    :param items: Iterable of items
+    :return: List of results in the order of the items
+    """
+
+    futures = [executor.submit(copy_context().run, function, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def get_error_reason(error):
+    """Return the reason given in the body of a Google API HttpError, such as userRateLimitExceeded.
+
+    :param error: googleapiclient.errors.HttpError
+    :return: Reason string, or None if the body does not include one
+    """
+
+    try:
+        content = error.content.decode('utf-8') if isinstance(error.content, bytes) else error.content
+        return json.loads(content)['error']['errors'][0]['reason']
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error):
+    """Return True if a failed API request may succeed when retried.
+
+    Server errors, 429 responses, 403 rate limit responses and network errors are retryable. Other client errors,
+    such as invalid queries or an exhausted daily limit, are not.
+
+    :param error: Exception raised by the request
+    :return: True if the request should be retried
+    """
+
+    if isinstance(error, HttpError):
+        status = int(error.resp.status)
+        return status in RETRYABLE_STATUSES or (status == 403 and get_error_reason(error) in RETRYABLE_REASONS)
+
+    return isinstance(error, (ConnectionError, TimeoutError, socket.timeout, httplib2.HttpLib2Error))
+
+
+def get_retry_delay(attempt):
+    """Return how long to wait before retrying a request, using exponential backoff with full jitter.
+
+    :param attempt: Number of attempts already made, starting at 1
+    :return: Delay in seconds
+    """
+
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+def execute_query(service, final_payload, max_retries=None):
+    """Execute a single API request for the given payload and return the response. If a RateLimiter is attached to
+    the service, the request waits for it first.
+
+    Transient errors, including timeouts, are retried with exponential backoff and jitter, so a failure only affects
+    the page being fetched. The timeout and hedge_after settings of the calling run_query() apply. The number of
+    requests actually sent, including retries and hedged requests, is stored in the apiCalls key of the response.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API
+    :param max_retries: Maximum number of retries (default MAX_RETRIES)
+    :return: Google Analytics API results set for one page
+    """
+
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    limiter = ratelimit.get_rate_limiter(service)
+    timeout = _request_timeout.get()
+    hedge_after = _hedge_after.get()
+    attempt = 0
+    sent = []
+
+    while True:
+        attempt += 1
+
+        if limiter is not None:
+            limiter.acquire(final_payload.get('ids'))
+
+        try:
+            if hedge_after is not None:
+                results = execute_hedged(service, final_payload, hedge_after, timeout, sent)
+            else:
+                request = service.data().ga().get(**final_payload)
+                sent.append(request)
+
+                if isinstance(service, connect.ServicePool):
+                    results = service.execute(request, timeout)
+                else:
+                    # A plain service has one transport, so the timeout also applies to its other requests meanwhile
+                    with connect.request_timeout(request.http, timeout):
+                        results = request.execute()
+
+            results['apiCalls'] = len(sent)
+            return results
+        except Exception as e:
+            if attempt > max_retries or not is_retryable_error(e):
+                raise
+            time.sleep(get_retry_delay(attempt))
+
+
+def execute_hedged(pool, final_payload, hedge_after, timeout=None, sent=None):
+    """Execute a request on a ServicePool, sending a second copy on another transport if the first has not returned
+    after hedge_after seconds, and return whichever response arrives first. The slower request is left to finish in
+    the background. The hedge counts against any RateLimiter attached to the pool.
+
+    :param pool: connect.ServicePool to execute the requests on
+    :param final_payload: Final payload to pass to API
+    :param hedge_after: Number of seconds to wait before sending the second request
+    :param timeout: Optional socket timeout in seconds for each request
+    :param sent: Optional list to which each request is appended as it is sent, to count them
+    :return: Google Analytics API results set for one page
+    """
+
+    limiter = ratelimit.get_rate_limiter(pool)
+    executor = ThreadPoolExecutor(max_workers=2)
+    sent = [] if sent is None else sent
+
+    def send():
+        request = pool.data().ga().get(**final_payload)
+        sent.append(request)
+        return pool.execute(request, timeout)
+
+    try:
+        pending = {executor.submit(send)}
+        done, pending = wait(pending, timeout=hedge_after)
+
+        if not done:
+            if limiter is not None:
+                limiter.acquire(final_payload.get('ids'))
+            pending.add(executor.submit(send))
+
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            if not pending:
+                return done.pop().result()
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    finally:
+        executor.shutdown(wait=False)
+
+
+def get_checkpoint_path(checkpoint_dir, final_payload, start_index):
+    """Return the path of the checkpoint file for a page of a query.
+
+    :param checkpoint_dir: Spool directory holding checkpointed pages
+    :param final_payload: Final payload to pass to API
+    :param start_index: 1-based index of the first row on the page
+    :return: Path to the checkpoint file
+    """
+
+    return os.path.join(checkpoint_dir, get_payload_key(final_payload), str(start_index) + '.json.gz')
+
+
+def clear_checkpoints(checkpoint_dir, final_payload):
+    """Delete the checkpointed pages of a query.
+
+    :param checkpoint_dir: Spool directory holding checkpointed pages
+    :param final_payload: Final payload to pass to API
+    """
+
+    shutil.rmtree(os.path.join(checkpoint_dir, get_payload_key(final_payload)), ignore_errors=True)
+
+
+def get_page(service, final_payload, start_index, checkpoint_dir=None):
+    """Fetch the page of results beginning at start_index.
+
+    If a checkpoint directory is set, a page that was fetched before is loaded from it instead of calling the API,
+    and a newly fetched page is saved to it.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API
+    :param start_index: 1-based index of the first row on the page
+    :param checkpoint_dir: Optional spool directory in which to checkpoint the page
+    :return: Google Analytics API results set for the page
+    """
+
+    if checkpoint_dir is None:
+        return execute_query(service, {**final_payload, 'start_index': start_index})
+
+    path = get_checkpoint_path(checkpoint_dir, final_payload, start_index)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            results = json.load(file)
+        results['apiCalls'] = 0
         return results
 
-    # Return a single page of results
+    results = execute_query(service, {**final_payload, 'start_index': start_index})
+
+    # Write to a temporary file first, so an interrupted write never leaves a truncated checkpoint
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as file:
+        json.dump(results, file)
+    os.replace(path + '.tmp', path)
+
+    return results
+
+
+def get_shared_service(service, workers):
+    """Return a service that can be shared by worker threads.
+
+    A plain service has a single HTTP transport, which is not thread-safe, so for more than one worker it is wrapped
+    in a connect.ServicePool with a transport for each worker. ServicePools are returned unchanged.
+
+    :param service: Google Analytics service object or connect.ServicePool
+    :param workers: Number of threads that will use the service concurrently
+    :return: Google Analytics service object or connect.ServicePool
+    """
+
+    if workers > 1 and not isinstance(service, connect.ServicePool):
+        return connect.ServicePool(service=service, size=workers)
+
+    return service
+
+
+def iter_pages(service, final_payload, workers=1, checkpoint_dir=None):
+    """Yield the API response for each page of a query in page order, starting with the initial response.
+
+    When workers is greater than 1, up to that many pages are fetched ahead concurrently on a thread pool, so only a
+    bounded number of pages are held in memory at any time.
+
+    If a checkpoint directory is set, each page is saved to it as it is fetched, keyed by the payload and start_index.
+    When an interrupted query is run again, pages already saved are loaded instead of fetched. The checkpoints of a
+    query are deleted once its last page has been yielded.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API
+    :param workers: Number of pages to fetch concurrently (default 1 fetches pages one after another)
+    :param checkpoint_dir: Optional spool directory in which to checkpoint pages
+    :return: Generator of Google Analytics API results sets, one per page
+    """
+
+    service = get_shared_service(service, workers)
+
+    if checkpoint_dir is None:
+        results = execute_query(service, final_payload)
     else:
-        return results
+        results = get_page(service, final_payload, 1, checkpoint_dir)
+    yield results
+
+    start_indexes = iter(get_start_indexes(results))
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            def submit(start_index):
+                return executor.submit(copy_context().run, get_page, service, final_payload, start_index,
+                                       checkpoint_dir)
+
+            pending = deque(submit(start_index) for start_index in islice(start_indexes, workers))
+            while pending:
+                page = pending.popleft().result()
+                for start_index in islice(start_indexes, 1):
+                    pending.append(submit(start_index))
+                yield page
+    else:
+        for start_index in start_indexes:
+            yield get_page(service, final_payload, start_index, checkpoint_dir)
+
+    if checkpoint_dir is not None:
+        clear_checkpoints(checkpoint_dir, final_payload)
+
+
+def get_results(service, final_payload, workers=1, checkpoint_dir=None):
+    """Passes a payload to the API using the service object and returns all available results by merging paginated
+    data together into a single DataSet.
+
+    The rows of the initial response are kept as the first page and only the remaining pages are requested, so a
+    query spanning N pages makes N API calls, plus any retries and hedged requests. The number of requests actually
+    sent, which is what counts against the API quotas, is stored in the apiCalls key of the result. When
+    workers is greater than 1 the remaining pages are fetched concurrently on a thread pool, and the rows are
+    reassembled in page order.
+
+    :param service: Google Analytics service object
+    :param final_payload: Final payload to pass to API
+    :param workers: Number of pages to fetch concurrently (default 1 fetches pages one after another)
+    :param checkpoint_dir: Optional spool directory in which to checkpoint pages, so an interrupted query can resume
+    :return: Original result object with rows data manipulated to contains rows from all pages
+    """
+
+    pages = iter_pages(service, final_payload, workers=workers, checkpoint_dir=checkpoint_dir)
+    return collect_pages(next(pages), pages)
+
+
+def collect_pages(results, pages):
+    """Append the rows of the remaining pages of a query to the results set of its first page.
+
+    :param results: Google Analytics API results set for the first page
+    :param pages: Iterable of results sets for the remaining pages
+    :return: Original result object with rows data manipulated to contains rows from all pages
+    """
+
+    api_calls = get_api_calls(results)
+
+    # Extend in place so earlier pages are never copied again
+    all_rows = results.get('rows', [])
+    for page in pages:
+        all_rows.extend(page.get('rows', []))
+        api_calls += get_api_calls(page)
+
+    # Replace rows in initial results with all rows
+    if all_rows:
+        results['rows'] = all_rows
+
+    results['apiCalls'] = api_calls
+    return results
+
+
+async def get_results_async(service, final_payload, max_concurrency=10, session=None, access_token=None):
+    """Asynchronous version of get_results(). The request URLs are built by the service object, but the HTTP calls are
+    issued on an aiohttp session, and every page after the first is fetched concurrently.
+
+    As with get_results(), each request waits for any RateLimiter attached to the service, and transient errors are
+    retried with exponential backoff and jitter.
+
+    :param service: Google Analytics service object. Its root URL decides where requests are sent.
+    :param final_payload: Final payload to pass to API
+    :param max_concurrency: Maximum number of page requests in flight at once
+    :param session: Optional aiohttp.ClientSession to reuse
+    :param access_token: Optional OAuth access token. Taken from the service credentials if not set.
+    :return: Original result object with rows data manipulated to contains rows from all pages
+    """
+
+    import aiohttp
+
+    if access_token is None:
+        access_token = connect.get_access_token(service)
+
+    headers = {'Authorization': 'Bearer ' + access_token}
+    semaphore = asyncio.BoundedSemaphore(max_concurrency)
+    limiter = ratelimit.get_rate_limiter(service)
+
+    async def fetch(client, page_payload):
+        request = service.data().ga().get(**page_payload)
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            try:
+                async with semaphore:
+                    if limiter is not None:
+                        await limiter.acquire_async(page_payload.get('ids'))
+
+                    async with client.request(request.method, request.uri, headers=headers) as response:
+                        if response.status >= 400:
+                            # Raised as an HttpError so errors are reported and retried as in execute_query()
+                            resp = httplib2.Response({'status': response.status})
+                            resp.reason = response.reason
+                            raise HttpError(resp, await response.read(), uri=request.uri)
+
+                        page = await response.json()
+                        page['apiCalls'] = attempt
+                        return page
+
+            except Exception as e:
+                network_error = isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+                if attempt > MAX_RETRIES or not (network_error or is_retryable_error(e)):
+                    raise
+                await asyncio.sleep(get_retry_delay(attempt))
+
+    async def fetch_all(client):
+        results = await fetch(client, final_payload)
+        start_indexes = get_start_indexes(results)
+        pages = await asyncio.gather(*(fetch(client, {**final_payload, 'start_index': start_index})
+                                       for start_index in start_indexes))
+        return collect_pages(results, pages)
+
+    if session is not None:
+        return await fetch_all(session)
+
+    async with aiohttp.ClientSession() as client:
+        return await fetch_all(client)
@@ -0,0 +1,211 @@
+"""
+Name: Rate limits Google Analytics API requests
+Description: Shares a token bucket across every request made through a service object, tracks the daily request
+budget of each view and lets interactive queries go ahead of batch exports.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+_priority = ContextVar('gapandas_priority', default=PRIORITY_BATCH)
+_limiters = weakref.WeakKeyDictionary()
+
+
+class QuotaExceededError(Exception):
+    """Raised when a view has used its daily request budget."""
+
+
+class RateLimiter:
+    """Token bucket rate limiter with per-view daily request budgets and a priority queue of waiting requests.
+
+    Requests wait until a token is available. While several are waiting, the one with the lowest priority number goes
+    first, and requests with the same priority go in arrival order. The clock, sleep and today functions can be
+    replaced with fakes in tests.
+
+    Args:
+        rate (float): Number of requests allowed per second (default 10, the per-IP limit of the Core Reporting API)
+        burst (int, optional): Maximum number of requests that can be made at once after a quiet period (at least 1)
+        daily_limit (int, optional): Maximum number of requests per view per day. None for no limit.
+        clock (function): Monotonic clock returning seconds
+        sleep (function): Function that waits for a number of seconds
+        today (function): Function returning the current date, used to reset the daily budgets
+    """
+
+    def __init__(self, rate=10, burst=None, daily_limit=10000, clock=time.monotonic, sleep=time.sleep,
+                 today=date.today):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+
+        self.rate = rate
+        # The bucket must hold at least one whole token, or a request could never be granted
+        self.burst = max(1, burst or rate)
+        self.daily_limit = daily_limit
+        self.clock = clock
+        self.sleep = sleep
+        self.today = today
+
+        self._tokens = self.burst
+        self._updated = clock()
+        self._day = today()
+        self._used = {}
+        self._waiting = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self.today() != self._day:
+            self._day = self.today()
+            self._used = {}
+
+    def remaining(self, view_id):
+        """Return the number of requests left in a view's daily budget, or None if there is no daily limit.
+
+        :param view_id: Google Analytics view ID, with or without the ga: prefix
+        :return: Number of requests remaining today
+        """
+
+        if self.daily_limit is None:
+            return None
+
+        with self._lock:
+            self._refill()
+            return self.daily_limit - self._used.get(str(view_id).replace('ga:', ''), 0)
+
+    def _check_budget(self, view_id):
+        if self.daily_limit is not None and self._used.get(view_id, 0) >= self.daily_limit:
+            raise QuotaExceededError('Daily request budget of ' + str(self.daily_limit) + ' used for view ' +
+                                     str(view_id))
+
+    def _take(self, view_id):
+        # Allow for floating point error, which could leave a wait too short to advance the clock
+        if self._tokens >= 1 - 1e-9:
+            self._tokens -= 1
+            self._used[view_id] = self._used.get(view_id, 0) + 1
+            return True
+        return False
+
+    def acquire(self, view_id=None, priority=None):
+        """Wait until a request for a view may be sent, then count it against the view's daily budget.
+
+        :param view_id: Google Analytics view ID the request is for
+        :param priority: Priority of the request, lower goes first. Defaults to the priority set with priority().
+        """
+
+        view_id = str(view_id).replace('ga:', '') if view_id is not None else None
+        ticket = (_priority.get() if priority is None else priority, next(self._counter))
+
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    self._check_budget(view_id)
+
+                    if self._waiting[0] == ticket:
+                        if self._take(view_id):
+                            heapq.heappop(self._waiting)
+                            return
+                        wait = (1 - self._tokens) / self.rate
+                    else:
+                        wait = 1 / self.rate
+
+                self.sleep(wait)
+
+        except BaseException:
+            with self._lock:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+            raise
+
+    def try_acquire(self, view_id=None, priority=None):
+        """Count a request against the rate limit and the view's daily budget if it may be sent now, without
+        waiting. Requests already waiting in acquire() with the same or a lower priority number go first.
+
+        :param view_id: Google Analytics view ID the request is for
+        :param priority: Priority of the request, lower goes first. Defaults to the priority set with priority().
+        :return: 0 if the request may be sent now, otherwise the number of seconds to wait before trying again
+        """
+
+        view_id = str(view_id).replace('ga:', '') if view_id is not None else None
+        level = _priority.get() if priority is None else priority
+
+        with self._lock:
+            self._refill()
+            self._check_budget(view_id)
+
+            if self._waiting and self._waiting[0][0] <= level:
+                return 1 / self.rate
+            if self._take(view_id):
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire_async(self, view_id=None, priority=None):
+        """Asynchronous version of acquire(), which waits with asyncio.sleep() instead of blocking the event loop.
+
+        :param view_id: Google Analytics view ID the request is for
+        :param priority: Priority of the request, lower goes first. Defaults to the priority set with priority().
+        """
+
+        while True:
+            wait = self.try_acquire(view_id, priority)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+@contextmanager
+def priority(level):
+    """Set the priority of every rate limited request made inside a with block, including requests made on the
+    worker threads started by gapandas.
+
+    :param level: Priority, such as PRIORITY_INTERACTIVE or PRIORITY_BATCH. Lower goes first.
+    """
+
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_rate_limiter(service, limiter):
+    """Rate limit every request made through a service object.
+
+    :param service: Google Analytics service object
+    :param limiter: RateLimiter to share, or None to remove rate limiting
+    """
+
+    if limiter is None:
+        _limiters.pop(service, None)
+    else:
+        _limiters[service] = limiter
+
+
+def get_rate_limiter(service):
+    """Return the RateLimiter attached to a service object, if any.
+
+    :param service: Google Analytics service object
+    :return: RateLimiter or None
+    """
+
+    try:
+        return _limiters.get(service)
+    except TypeError:
+        return None
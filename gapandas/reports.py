@@ -85,7 +85,7 @@ def monthly_coupons_overview(service, view, start_date, end_date, format=True):
 
     """
 
-    # All orders
+    # Fetch all orders, coupon orders and non-coupon orders together in one batch request
     api_payload = {
         'start_date': start_date,
         'end_date': end_date,
@@ -94,7 +94,14 @@ def monthly_coupons_overview(service, view, start_date, end_date, format=True):
         'sort': '-ga:yearMonth'
     }
 
-    df_all_orders = query.run_query(service, view, api_payload)
+    results = query.run_query_batch(service, {
+        'all_orders': (view, api_payload),
+        'coupon': (view, {**api_payload, 'filters': 'ga:orderCouponCode!=(not set)'}),
+        'non_coupon': (view, {**api_payload, 'filters': 'ga:orderCouponCode==(not set)'}),
+    })
+
+    # All orders
+    df_all_orders = results['all_orders']
     df_all_orders['date'] = pd.to_datetime(df_all_orders['yearMonth'], format='%Y%m')
     df_all_orders['yearMonth'] = df_all_orders['date'].dt.strftime('%B, %Y')
     df_all_orders = df_all_orders.drop(columns=['date'])
@@ -106,16 +113,7 @@ def monthly_coupons_overview(service, view, start_date, end_date, format=True):
     })
 
     # Coupon orders
-    api_payload = {
-        'start_date': start_date,
-        'end_date': end_date,
-        'metrics': 'ga:transactions, ga:transactionRevenue, ga:revenuePerTransaction',
-        'dimensions': 'ga:yearMonth',
-        'sort': '-ga:yearMonth',
-        'filters': 'ga:orderCouponCode!=(not set)'
-    }
-
-    df_coupon = query.run_query(service, view, api_payload)
+    df_coupon = results['coupon']
     df_coupon['date'] = pd.to_datetime(df_coupon['yearMonth'], format='%Y%m')
     df_coupon['yearMonth'] = df_coupon['date'].dt.strftime('%B, %Y')
     df_coupon = df_coupon.drop(columns=['date'])
@@ -127,16 +125,7 @@ def monthly_coupons_overview(service, view, start_date, end_date, format=True):
     })
 
     # Non-coupon
-    api_payload = {
-        'start_date': start_date,
-        'end_date': end_date,
-        'metrics': 'ga:transactions, ga:transactionRevenue, ga:revenuePerTransaction',
-        'dimensions': 'ga:yearMonth',
-        'sort': '-ga:yearMonth',
-        'filters': 'ga:orderCouponCode==(not set)'
-    }
-
-    df_non_coupon = query.run_query(service, view, api_payload)
+    df_non_coupon = results['non_coupon']
     df_non_coupon['date'] = pd.to_datetime(df_non_coupon['yearMonth'], format='%Y%m')
     df_non_coupon['yearMonth'] = df_non_coupon['date'].dt.strftime('%B, %Y')
     df_non_coupon = df_non_coupon.drop(columns=['date'])
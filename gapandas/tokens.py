@@ -0,0 +1,185 @@
+"""
+Name: Caches Google Analytics API access tokens
+Description: Shares OAuth access tokens between processes through files on the local filesystem, so that short-lived
+jobs using the same keyfile do not each exchange their own token, and refreshes tokens shortly before they expire.
+"""
+
+import hashlib
+import json
+import os
+import os.path
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import httplib2
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TOKEN_CACHE_DIR = os.path.join('~', '.cache', 'gapandas', 'tokens')
+
+# Number of seconds before expiry at which a cached token is treated as stale and refreshed
+REFRESH_MARGIN = 300
+
+# Socket timeout in seconds for token exchanges, so a hung token endpoint cannot block a refresh indefinitely
+TOKEN_TIMEOUT = 60
+
+# TokenCache used by services created with token_cache=True
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class TokenCache:
+    """File based cache of access tokens keyed by keyfile and scopes, shared by every process on the machine.
+
+    A lock file is held while a token is read, refreshed and written, so when several processes need a new token at
+    once only the first exchanges it and the rest read the result. File locks need fcntl. Where it is not available
+    the lock only applies to threads within the process. Tokens are refreshed in a background thread shortly before
+    they expire, so requests do not wait for a token exchange. There is one refresh timer per token file. It holds
+    the credentials using the token weakly and stops once they have all been garbage collected.
+
+    Args:
+        path (str): Directory to store tokens in, created if it does not exist
+        margin (int, optional): Number of seconds before expiry at which a token is refreshed
+        refresh (bool, optional): Refresh tokens in a background thread before they expire (default True)
+        timeout (float, optional): Socket timeout in seconds for token exchanges (default 60)
+    """
+
+    def __init__(self, path=TOKEN_CACHE_DIR, margin=REFRESH_MARGIN, refresh=True, timeout=TOKEN_TIMEOUT):
+        self.path = os.path.expanduser(path)
+        self.margin = margin
+        self.refresh = refresh
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._holders = {}
+
+    def _token_path(self, keyfile_path, scopes):
+        key = json.dumps([os.path.abspath(keyfile_path), scopes])
+        return os.path.join(self.path, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    @contextmanager
+    def _locked(self, token_path):
+        os.makedirs(self.path, exist_ok=True)
+
+        with self._lock, open(token_path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, token_path):
+        try:
+            with open(token_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, token_path, token):
+        temp_path = token_path + '.tmp'
+        file = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file, 'w') as file:
+            json.dump(token, file)
+        os.replace(temp_path, token_path)
+
+    def authorize(self, credentials, keyfile_path, scopes):
+        """Give credentials a valid access token from the cache, exchanging a new one if the cached token is missing
+        or about to expire, and schedule its background refresh.
+
+        :param credentials: oauth2client credentials built from the keyfile
+        :param keyfile_path: Path to client_secrets.json
+        :param scopes: OAuth scopes the credentials were built with
+        :return: Unix time at which the access token expires
+        """
+
+        token_path = self._token_path(keyfile_path, scopes)
+        token = self._get_token(token_path, credentials)
+        self._apply(credentials, token)
+
+        if self.refresh:
+            with self._lock:
+                self._holders.setdefault(token_path, weakref.WeakSet()).add(credentials)
+            self._schedule(token_path, token['expires'])
+
+        return token['expires']
+
+    def _get_token(self, token_path, credentials):
+        with self._locked(token_path):
+            token = self._read(token_path)
+
+            if token is None or token['expires'] - self.margin <= time.time():
+                credentials.refresh(httplib2.Http(timeout=self.timeout))
+                expires = credentials.token_expiry.replace(tzinfo=timezone.utc).timestamp()
+                token = {'access_token': credentials.access_token, 'expires': expires}
+                self._write(token_path, token)
+
+        return token
+
+    def _apply(self, credentials, token):
+        credentials.access_token = token['access_token']
+        credentials.token_expiry = datetime.fromtimestamp(token['expires'], timezone.utc).replace(tzinfo=None)
+
+    def _schedule(self, token_path, expires):
+        timer = threading.Timer(max(expires - self.margin - time.time(), 0) + 1, self._refresh, (token_path,))
+        timer.daemon = True
+
+        with self._lock:
+            previous = self._timers.pop(token_path, None)
+            if previous is not None:
+                previous.cancel()
+            self._timers[token_path] = timer
+
+        timer.start()
+
+    def _refresh(self, token_path):
+        with self._lock:
+            holders = list(self._holders.get(token_path, ()))
+            if not holders:
+                self._holders.pop(token_path, None)
+                self._timers.pop(token_path, None)
+                return
+
+        try:
+            token = self._get_token(token_path, holders[0])
+        except Exception:
+            # The request that finds the token expired will refresh it instead
+            return
+
+        for credentials in holders:
+            self._apply(credentials, token)
+
+        del holders
+        self._schedule(token_path, token['expires'])
+
+    def clear(self):
+        """Cancel background refreshes and remove every cached token."""
+
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._holders.clear()
+
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.path, name))
+
+
+def get_default_cache():
+    """Return the TokenCache shared by services created with token_cache=True, stored in TOKEN_CACHE_DIR."""
+
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TokenCache()
+        return _default_cache
@@ -24,7 +24,11 @@ setup(
         'Intended Audience :: Developers',
         'Topic :: Software Development :: Libraries :: Python Modules',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
     ],
-    install_requires=['pandas', 'google-api-python-client', 'oauth2client']
+    python_requires='>=3.7',
+    install_requires=['pandas', 'google-api-python-client>=2.0', 'oauth2client'],
+    extras_require={'async': ['aiohttp'], 'arrow': ['pyarrow']}
 )